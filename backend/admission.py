@@ -0,0 +1,267 @@
+"""
+Overload protection for the generation endpoints.
+
+- Admission control: a bounded number of generations run at once, a bounded
+  number wait. New requests are rejected up front (503 + Retry-After) when
+  the estimated wait would exceed the limit, instead of piling up in the
+  threadpool until clients time out. Queue places and slots are shared
+  fairly between clients, interactive work first.
+- Deadlines: every request carries a deadline that caps the upstream call
+  timeout and PDF rendering, and is cancelled when the client disconnects.
+"""
+
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from .fair_scheduler import BATCH, PRIORITIES
+
+
+class OverloadedError(Exception):
+    """
+    Raised when a request is shed; retry_after is in whole seconds.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request runs out of time or its client went away.
+    """
+
+
+class RenderCancelled(Exception):
+    """Raised when should_stop() asks an in-progress render to stop."""
+
+
+class Deadline:
+    """
+    Absolute deadline for one request, shared with the worker thread.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def expired(self) -> bool:
+        return self.cancelled or self.remaining() <= 0
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise DeadlineExceeded("Client disconnected")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+
+
+class _Ticket:
+    __slots__ = ("client", "rank", "start", "finish", "seq")
+
+    def __init__(self, client, start: float, seq: int):
+        self.client = client
+        self.rank = PRIORITIES.index(client.priority)
+        self.start = start
+        self.finish = start + 1 / client.weight
+        self.seq = seq
+
+    def order(self):
+        return (self.rank, self.finish, self.seq)
+
+
+class AdmissionController:
+    """
+    Bounded concurrency plus a bounded queue with wait-time based shedding,
+    fair across clients.
+
+    reserve(client) is called on the event loop, before the request takes a
+    threadpool thread; slot() then runs in the worker thread and waits for
+    one of the `max_concurrent` execution slots.
+
+    - Each client may hold at most `max_queue_per_client` queued requests,
+      and batch requests at most half of the queue, so one bulk client
+      cannot fill it and shed everyone else.
+    - A free slot goes to interactive work first, then by weighted fair
+      queuing tags (one unit per request), preferring clients below their
+      weighted share of the slots; a client may use more than its share
+      while nobody else is waiting.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_queue: int = 32,
+        max_wait_seconds: float = 30.0,
+        max_queue_per_client: Optional[int] = None,
+        initial_service_seconds: float = 15.0,
+        smoothing: float = 0.2,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.max_queue_per_client = max_queue_per_client or max(1, max_queue // 4)
+        self.smoothing = smoothing
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._running: Dict[str, int] = {}
+        self._queued: Dict[Tuple[str, str], int] = {}  # (client_id, priority) -> reserved
+        self._tickets = []  # reserved requests waiting inside slot()
+        self._weights: Dict[str, float] = {}
+        self._avg_service = initial_service_seconds
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def _waiting_locked(self) -> int:
+        return sum(self._queued.values())
+
+    def estimated_wait(self, client=None) -> float:
+        """
+        Seconds a newly admitted request (from `client`, if given) would
+        wait for a slot.
+        """
+        with self._cond:
+            return self._estimated_wait_locked(client)
+
+    def _estimated_wait_locked(self, client=None) -> float:
+        running = sum(self._running.values())
+        if client is None:
+            ahead = self._waiting_locked()
+        else:
+            # Fair dispatch interleaves clients of the same class, so another
+            # client's backlog only counts up to this client's own position.
+            rank = PRIORITIES.index(client.priority)
+            position = self._queued.get((client.client_id, client.priority), 0) + 1
+            ahead = sum(
+                count if PRIORITIES.index(priority) < rank else min(count, position)
+                for (_, priority), count in self._queued.items()
+                if PRIORITIES.index(priority) <= rank
+            )
+        if running + ahead < self.max_concurrent:
+            return 0.0
+        return (running + ahead - self.max_concurrent + 1) / self.max_concurrent * self._avg_service
+
+    def reserve(self, client, max_wait_seconds: Optional[float] = None) -> None:
+        """
+        Claims a place in the queue for `client` or raises OverloadedError.
+        max_wait_seconds overrides the configured limit, e.g. 0 for
+        background work that should only run on an idle slot.
+        """
+        limit = self.max_wait_seconds if max_wait_seconds is None else max_wait_seconds
+        key = (client.client_id, client.priority)
+        with self._cond:
+            wait = self._estimated_wait_locked(client)
+            waiting = self._waiting_locked()
+            batch_waiting = sum(n for (_, priority), n in self._queued.items() if priority == BATCH)
+            client_waiting = sum(n for (cid, _), n in self._queued.items() if cid == client.client_id)
+            if (
+                waiting >= self.max_queue
+                or client_waiting >= self.max_queue_per_client
+                or (client.priority == BATCH and batch_waiting >= self.max_queue // 2)
+                or wait > limit
+            ):
+                self._rejected += 1
+                raise OverloadedError(max(1, math.ceil(wait)))
+            self._queued[key] = self._queued.get(key, 0) + 1
+            self._weights[client.client_id] = client.weight
+            self._admitted += 1
+
+    def _share_locked(self, client_id: str) -> int:
+        active = {t.client.client_id for t in self._tickets} | {
+            cid for cid, n in self._running.items() if n
+        }
+        total = sum(self._weights[cid] for cid in active) or 1.0
+        return max(1, int(self.max_concurrent * self._weights[client_id] / total))
+
+    def _next_locked(self) -> Optional[_Ticket]:
+        if not self._tickets or sum(self._running.values()) >= self.max_concurrent:
+            return None
+        ordered = sorted(self._tickets, key=_Ticket.order)
+        return next(
+            (
+                t for t in ordered
+                if self._running.get(t.client.client_id, 0) < self._share_locked(t.client.client_id)
+            ),
+            ordered[0],
+        )
+
+    def _unqueue_locked(self, client) -> None:
+        key = (client.client_id, client.priority)
+        self._queued[key] -= 1
+        if not self._queued[key]:
+            del self._queued[key]
+
+    @contextmanager
+    def slot(self, client, deadline: Deadline):
+        """
+        Waits (within the deadline) for an execution slot reserved earlier.
+        """
+        cid = client.client_id
+        with self._cond:
+            start = max(self._virtual_time, self._last_finish.get(cid, 0.0))
+            ticket = _Ticket(client, start, next(self._seq))
+            self._last_finish[cid] = ticket.finish
+            self._tickets.append(ticket)
+            while self._next_locked() is not ticket:
+                if deadline.expired():
+                    self._tickets.remove(ticket)
+                    self._unqueue_locked(client)
+                    self._timed_out += 1
+                    self._cond.notify_all()
+                    deadline.check()
+                # Wake up at least once a second to notice client disconnects.
+                self._cond.wait(timeout=max(0.01, min(deadline.remaining(), 1.0)))
+            self._tickets.remove(ticket)
+            self._unqueue_locked(client)
+            self._running[cid] = self._running.get(cid, 0) + 1
+            self._virtual_time = max(self._virtual_time, ticket.start)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._running[cid] -= 1
+                self._avg_service = (1 - self.smoothing) * self._avg_service + self.smoothing * elapsed
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            clients = {}
+            for cid in sorted({cid for cid, _ in self._queued} | {cid for cid, n in self._running.items() if n}):
+                clients[cid] = {
+                    "running": self._running.get(cid, 0),
+                    "queued": sum(n for (c, _), n in self._queued.items() if c == cid),
+                    "queued_batch": self._queued.get((cid, BATCH), 0),
+                }
+            return {
+                "running": sum(self._running.values()),
+                "queued": self._waiting_locked(),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_queue_per_client": self.max_queue_per_client,
+                "estimated_wait_seconds": round(self._estimated_wait_locked(), 2),
+                "avg_service_seconds": round(self._avg_service, 2),
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "timed_out_in_queue": self._timed_out,
+                "clients": clients,
+            }
@@ -0,0 +1,276 @@
+"""
+Booklet PDF: many itineraries in one document.
+
+Itineraries are streamed through a single reportlab document with shared
+styles, a table of contents and one itinerary per page run. Flowables are
+produced lazily from an on-disk spool, so memory stays flat no matter
+how many itineraries go in; only the finished page streams accumulate.
+
+Table-of-contents page numbers are PDF form XObjects referenced from the
+contents pages and defined when each itinerary is actually laid out, so
+the whole booklet is built in a single pass.
+"""
+
+import json
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, PageBreak, Paragraph, SimpleDocTemplate
+
+from .pdf_generator import RenderCancelled, itinerary_styles, itinerary_story
+
+# (title, itinerary) - title is plain text, e.g. the client's name.
+BookletEntry = Tuple[str, Dict[str, Any]]
+
+TOC_FONT = "Helvetica"
+TOC_FONT_SIZE = 11
+TOC_LINE_HEIGHT = 16
+
+# How many flowables the layout engine may look ahead (keepWithNext chains).
+STORY_LOOKAHEAD = 32
+
+
+class _LazyStory:
+    """
+    The list-like view of a flowable iterator that reportlab's build loop
+    needs: it only ever touches the front of the list, so a small buffer
+    refilled from the iterator is enough.
+    """
+
+    def __init__(self, flowables: Iterable[Flowable], lookahead: int = STORY_LOOKAHEAD):
+        self._source = iter(flowables)
+        self._buffer = []
+        self._lookahead = lookahead
+        self._exhausted = False
+
+    def _fill(self) -> None:
+        while not self._exhausted and len(self._buffer) < self._lookahead:
+            try:
+                self._buffer.append(next(self._source))
+            except StopIteration:
+                self._exhausted = True
+
+    def __len__(self) -> int:
+        self._fill()
+        return len(self._buffer)
+
+    def __getitem__(self, index):
+        self._fill()
+        return self._buffer[index]
+
+    def __setitem__(self, index, value) -> None:
+        self._buffer[index] = value
+
+    def __delitem__(self, index) -> None:
+        del self._buffer[index]
+
+    def insert(self, index: int, value: Flowable) -> None:
+        self._buffer.insert(index, value)
+
+
+def _page_form(index: int) -> str:
+    return f"booklet_page_{index}"
+
+
+def _bookmark(index: int) -> str:
+    return f"itinerary_{index}"
+
+
+class _TocLine(Flowable):
+    """One contents line: title, dot leaders, and a forward-referenced page number."""
+
+    def __init__(self, index: int, title: str):
+        super().__init__()
+        self.index = index
+        self.title = title
+
+    def wrap(self, available_width, available_height):
+        self.width = available_width
+        return available_width, TOC_LINE_HEIGHT
+
+    def draw(self):
+        canv = self.canv
+        number_width = stringWidth("0000", TOC_FONT, TOC_FONT_SIZE)
+        title_room = self.width - number_width - 12
+
+        title = self.title
+        if stringWidth(title, TOC_FONT, TOC_FONT_SIZE) > title_room:
+            while title and stringWidth(title + "…", TOC_FONT, TOC_FONT_SIZE) > title_room:
+                title = title[:-1]
+            title += "…"
+        title_width = stringWidth(title, TOC_FONT, TOC_FONT_SIZE)
+
+        canv.setFont(TOC_FONT, TOC_FONT_SIZE)
+        canv.drawString(0, 4, title)
+        dot_width = stringWidth(" .", TOC_FONT, TOC_FONT_SIZE)
+        dots = int((self.width - number_width - title_width - 8) / dot_width)
+        if dots > 0:
+            canv.drawRightString(self.width - number_width, 4, " ." * dots)
+
+        canv.saveState()
+        canv.translate(self.width, 4)
+        canv.doForm(_page_form(self.index))
+        canv.restoreState()
+        canv.linkRect("", _bookmark(self.index), (0, 0, self.width, TOC_LINE_HEIGHT), relative=1)
+
+
+class _ItineraryAnchor(Flowable):
+    """
+    Zero-size marker at the start of each itinerary. Drawing it fixes the
+    page number the contents line points to, and adds a bookmark and an
+    outline entry for the PDF viewer's sidebar.
+    """
+
+    def __init__(self, index: int, title: str):
+        super().__init__()
+        self.index = index
+        self.title = title
+
+    def wrap(self, available_width, available_height):
+        return 0, 0
+
+    def draw(self):
+        canv = self.canv
+        canv.bookmarkPage(_bookmark(self.index))
+        canv.addOutlineEntry(self.title, _bookmark(self.index), level=0)
+
+        canv.beginForm(_page_form(self.index), lowerx=-72, lowery=-4, upperx=0, uppery=TOC_LINE_HEIGHT)
+        canv.setFont(TOC_FONT, TOC_FONT_SIZE)
+        canv.drawRightString(0, 0, str(canv.getPageNumber()))
+        canv.endForm()
+
+
+def _spool(entries: Iterable[BookletEntry], spool) -> list:
+    """
+    Writes the itineraries to the spool file one JSON line at a time and
+    returns only their titles, which the contents pages need up front.
+    """
+    titles = []
+    for title, itinerary in entries:
+        spool.write(json.dumps(itinerary))
+        spool.write("\n")
+        titles.append(title)
+    spool.flush()
+    spool.seek(0)
+    return titles
+
+
+def _booklet_story(booklet_title: str, titles: list, spool) -> Iterator[Flowable]:
+    styles = itinerary_styles()
+
+    yield Paragraph(escape(booklet_title), styles["title"])
+    yield Paragraph("Contents", styles["day_heading"])
+    for index, title in enumerate(titles):
+        yield _TocLine(index, title)
+
+    for index, (title, line) in enumerate(zip(titles, spool)):
+        yield PageBreak()
+        yield _ItineraryAnchor(index, title)
+        yield from itinerary_story(json.loads(line), styles, title=escape(title))
+
+
+def generate_booklet_pdf(
+    entries: Iterable[BookletEntry],
+    output_path,
+    booklet_title: str = "Travel Itineraries",
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> int:
+    """
+    Render many itineraries into one PDF with a table of contents.
+
+    Args:
+        entries: Iterable of (title, itinerary) pairs; may be a one-shot
+            generator (e.g. rows streamed from the itinerary store)
+        output_path: File path or binary file object, as for
+            generate_itinerary_pdf
+        booklet_title: Heading of the contents page
+        should_stop: Optional callable checked on every page; returning
+            True aborts the render with RenderCancelled
+
+    Returns:
+        The number of itineraries in the booklet
+    """
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        titles = _spool(entries, spool)
+
+        doc = SimpleDocTemplate(
+            output_path,
+            pagesize=letter,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=36,
+            title=booklet_title,
+        )
+
+        def on_page(canvas, doc):
+            if should_stop is not None and should_stop():
+                raise RenderCancelled("Booklet rendering cancelled")
+            canvas.setFont(TOC_FONT, 9)
+            canvas.drawCentredString(letter[0] / 2, 18, str(canvas.getPageNumber()))
+
+        doc.build(
+            _LazyStory(_booklet_story(booklet_title, titles, spool)),
+            onFirstPage=on_page,
+            onLaterPages=on_page,
+        )
+
+    return len(titles)
+
+
+# Local benchmark; not used by FastAPI.
+# python -m backend.booklet [count]
+if __name__ == "__main__":
+    import io
+    import resource
+    import sys
+    import time
+
+    from .pdf_generator import generate_itinerary_pdf
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    def sample(n: int) -> Dict[str, Any]:
+        return {
+            "days": [
+                {
+                    "day": day,
+                    "sections": {
+                        "morning": [f"Walk the old town, stop {n}-{day}", "Coffee at a local roaster"],
+                        "afternoon": ["Museum visit with a guided tour", "Lunch near the harbour"],
+                        "evening": ["Dinner at a family-run restaurant"],
+                    },
+                }
+                for day in range(1, 6)
+            ],
+            "summary": f"A relaxed five-day trip for client {n}.",
+        }
+
+    def entries() -> Iterator[BookletEntry]:
+        for n in range(count):
+            yield f"Client {n:04d} - Lisbon, 5 days", sample(n)
+
+    def peak_rss_mb() -> float:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    out = io.BytesIO()
+    rendered = generate_booklet_pdf(entries(), out)
+    booklet_seconds = time.perf_counter() - started
+    booklet_peak = peak_rss_mb()
+
+    per_count = min(count, 100)
+    started = time.perf_counter()
+    for n in range(per_count):
+        generate_itinerary_pdf(sample(n), io.BytesIO())
+    per_seconds = (time.perf_counter() - started) / per_count * count
+
+    print(f"booklet: {rendered} itineraries in {booklet_seconds:.2f}s "
+          f"({rendered / booklet_seconds:.0f}/s), {len(out.getvalue()) / 1e6:.1f} MB PDF")
+    print(f"peak RSS: {baseline:.0f} MB before, {booklet_peak:.0f} MB after")
+    print(f"separate PDFs (extrapolated from {per_count}): {per_seconds:.2f}s")
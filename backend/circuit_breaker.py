@@ -0,0 +1,180 @@
+"""
+Circuit breaker around the model provider.
+
+While the provider is down or very slow, every request would otherwise wait
+out the full upstream timeout. The breaker trips on the error rate or the
+slow-call rate over a sliding window, fails fast while open, and lets a
+single probe through (half-open) after a cooldown to recover automatically.
+
+With several worker processes, a trip is published through an optional
+shared cache; the other workers pick it up within a second and open too,
+instead of each one paying for its own window of failed calls.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+# How often a closed breaker checks whether another worker tripped.
+SHARED_CHECK_SECONDS = 1.0
+SHARED_KEY = "open_until"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling upstream while the circuit is open.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Model provider is unavailable (circuit open)")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_rate_threshold: float = 0.5,
+        open_seconds: float = 30.0,
+        shared=None,
+    ):
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # (failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._counters = {"calls": 0, "failures": 0, "rejected": 0, "trips": 0, "shared_trips": 0}
+        self._shared = shared
+        self._shared_checked_at = 0.0
+        self._publish_open_until = None
+
+    def _adopt_shared_trip(self) -> None:
+        """
+        Opens this breaker if another worker tripped its own recently.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._state != CLOSED or now - self._shared_checked_at < SHARED_CHECK_SECONDS:
+                return
+            self._shared_checked_at = now
+        raw = self._shared.get(SHARED_KEY, record=False)
+        remaining = float(raw) - time.time() if raw is not None else 0.0
+        if remaining <= 0:
+            return
+        with self._lock:
+            if self._state == CLOSED:
+                self._state = OPEN
+                self._opened_at = time.monotonic() - (self.open_seconds - min(remaining, self.open_seconds))
+                self._outcomes.clear()
+                self._counters["shared_trips"] += 1
+
+    def _publish_trip(self) -> None:
+        with self._lock:
+            open_until, self._publish_open_until = self._publish_open_until, None
+        if open_until is not None and self._shared is not None:
+            self._shared.put(SHARED_KEY, str(open_until).encode("utf-8"))
+
+    def _current_state_locked(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state_locked()
+
+    def retry_after(self) -> int:
+        with self._lock:
+            remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def before_call(self) -> None:
+        """
+        Raises CircuitOpenError if the call must not go upstream.
+        """
+        if self._shared is not None:
+            self._adopt_shared_trip()
+        with self._lock:
+            state = self._current_state_locked()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._counters["rejected"] += 1
+            remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+        raise CircuitOpenError(max(1, int(remaining + 0.999)))
+
+    def record_success(self, duration: float) -> None:
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            self._counters["calls"] += 1
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if slow:
+                    self._trip_locked()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+            else:
+                self._outcomes.append((False, slow))
+                self._evaluate_locked()
+        self._publish_trip()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["failures"] += 1
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._trip_locked()
+            else:
+                self._outcomes.append((True, False))
+                self._evaluate_locked()
+        self._publish_trip()
+
+    def record_ignored(self) -> None:
+        """
+        The call ended without telling us anything about upstream health
+        (e.g. the client disconnected); frees the half-open probe.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _evaluate_locked(self) -> None:
+        if self._state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        total = len(self._outcomes)
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, was_slow in self._outcomes if was_slow)
+        if failures / total >= self.error_rate_threshold or slow / total >= self.slow_rate_threshold:
+            self._trip_locked()
+
+    def _trip_locked(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._counters["trips"] += 1
+        self._publish_open_until = time.time() + self.open_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state_locked()
+            return {"state": state, "window_calls": len(self._outcomes), **self._counters}
@@ -0,0 +1,150 @@
+"""
+Two-stage discover mode.
+
+Stage one asks the model for a short ranked list of candidate destinations
+with a tiny token budget. Stage two (the regular /generate-itinerary call)
+plans day by day for the candidate the user picked. The top candidate can
+be prefetched in the background so picking it returns immediately.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+
+def build_shortlist_prompt(ctx) -> str:
+    """
+    Compact prompt for ranking destinations.
+    Only the fields that decide *where* to go are included; pacing and
+    activity preferences are left for the full itinerary prompt.
+    """
+    if ctx.international_travel:
+        travel_scope = f"International travel: Yes\nPreferred countries: {ctx.preferred_countries or 'Not specified'}"
+    else:
+        travel_scope = f"International travel: No\nMaximum distance from origin: {ctx.distance_preference or 'Not specified'}"
+
+    return f"""
+You are an expert travel planner. Shortlist destinations only; do not plan days.
+
+User intent / desired experiences: {ctx.discovery_intent or "Not specified"}
+Current location (city, country): {ctx.origin_location}
+Transportation mode to destination: {ctx.transport_mode}
+{travel_scope}
+Trip length (days): {ctx.days or "Not specified"}
+Date range (if known): {ctx.date_range or "Not specified"}
+Planned trip structure (one area vs multiple areas): {ctx.area_structure}
+Weather conditions to avoid: {ctx.weather_avoidance or "Not specified"}
+General interests: {ctx.interests or "Not specified"}
+Budget sensitivity: {ctx.budget_concern}
+Excluded places or attractions: {ctx.excluded_places or "None"}
+
+Rules:
+- Every candidate must be reachable from the current location by the stated transportation mode.
+- If international travel is No, every candidate must be within the maximum distance.
+- If international travel is Yes, every candidate must be in one of the preferred countries.
+- Only suggest real, publicly accessible destinations.
+""".strip()
+
+
+class ShortlistPrefetcher:
+    """
+    Background generation of the top shortlist candidate.
+
+    Futures are keyed by (shortlist_id, destination). Only the most recent
+    `max_entries` shortlists are kept so abandoned prefetches do not pile up.
+
+    With a `shared` cache (multi-worker mode) the prefetch state is also
+    published there, so the follow-up request can pick up the result even
+    when it lands on a different worker than the shortlist did.
+    """
+
+    # How often a worker checks the shared cache for another worker's prefetch.
+    POLL_SECONDS = 0.25
+
+    def __init__(self, max_workers: int = 2, max_entries: int = 128, shared=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._futures: "OrderedDict[tuple, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._shared = shared
+
+    @staticmethod
+    def _key(shortlist_id: str, destination: str) -> tuple:
+        return (shortlist_id, destination.strip().lower())
+
+    def _publish(self, key: tuple, status: str, itinerary: Optional[Dict[str, Any]] = None) -> None:
+        if self._shared is not None:
+            self._shared.put(key, json.dumps({"status": status, "itinerary": itinerary}).encode("utf-8"))
+
+    def _run(self, key: tuple, fn: Callable[..., Any], *args) -> Any:
+        try:
+            itinerary = fn(*args)
+        except Exception:
+            self._publish(key, "failed")
+            raise
+        self._publish(key, "done", itinerary)
+        return itinerary
+
+    def submit(self, shortlist_id: str, destination: str, fn: Callable[..., Any], *args) -> None:
+        key = self._key(shortlist_id, destination)
+        self._publish(key, "pending")
+        future = self._executor.submit(self._run, key, fn, *args)
+        with self._lock:
+            self._futures[self._key(shortlist_id, destination)] = future
+            while len(self._futures) > self._max_entries:
+                _, stale = self._futures.popitem(last=False)
+                stale.cancel()
+
+    def take(
+        self,
+        shortlist_id: str,
+        destination: Optional[str],
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the prefetched itinerary, waiting up to `timeout` seconds if
+        it is still running. Returns None when nothing was prefetched for
+        this pick, it failed, or it did not finish in time, in which case
+        the caller generates normally. A prefetch that is still running is
+        left in place, so a later take (e.g. a retry) can still use it.
+        """
+        if not destination:
+            return None
+        key = self._key(shortlist_id, destination)
+        with self._lock:
+            future = self._futures.get(key)
+        if future is None:
+            return self._take_shared(key, timeout)
+        try:
+            itinerary = future.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+        except Exception:
+            itinerary = None
+        with self._lock:
+            self._futures.pop(key, None)
+        if self._shared is not None:
+            self._shared.delete(key)
+        return itinerary
+
+    def _take_shared(self, key: tuple, timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+        """
+        Waits for a prefetch running on another worker.
+        """
+        if self._shared is None:
+            return None
+        give_up = time.monotonic() + (timeout or 0)
+        while True:
+            raw = self._shared.get(key, record=False)
+            if raw is None:
+                return None
+            entry = json.loads(raw)
+            if entry["status"] != "pending":
+                self._shared.delete(key)
+                return entry["itinerary"]
+            if time.monotonic() >= give_up:
+                return None
+            time.sleep(self.POLL_SECONDS)
@@ -0,0 +1,239 @@
+"""
+Weighted fair queuing of upstream model calls across API clients.
+
+Clients are identified by their X-API-Key header. Each configured client has
+a weight and a default priority class. Calls wait in a single scheduler in
+front of the model:
+
+- Interactive calls are always dispatched before batch calls.
+- Within a class, calls are ordered by weighted-fair-queuing finish tags
+  (estimated tokens / weight), so each client receives a weighted share of
+  the token budget no matter how many requests it submits.
+- A client may hold at most its weighted share of the concurrent slots while
+  others are waiting (work-conserving: idle capacity is still used).
+- An optional tokens-per-minute budget delays dispatch instead of letting
+  upstream rate limits fail the call.
+"""
+
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+
+class ClientIdentity:
+    __slots__ = ("client_id", "weight", "priority", "daily_token_budget")
+
+    def __init__(
+        self,
+        client_id: str,
+        weight: float = 1.0,
+        priority: str = INTERACTIVE,
+        daily_token_budget: Optional[int] = None,
+    ):
+        self.client_id = client_id
+        self.weight = weight
+        self.priority = priority
+        self.daily_token_budget = daily_token_budget
+
+    def with_priority(self, priority: str) -> "ClientIdentity":
+        return ClientIdentity(self.client_id, self.weight, priority, self.daily_token_budget)
+
+
+class ClientRegistry:
+    """
+    Maps API keys to client identities.
+
+    `config` is a JSON object of {"<api key>": {"name": ..., "weight": ...,
+    "priority": "interactive" | "batch", "daily_token_budget": ...}}; all
+    entries but the name are optional. Configured keys without a name get
+    an id derived from a hash of the key, so raw keys never show up in stats.
+
+    Requests without a key or with an unknown one all share the single
+    "anonymous" identity (weight 1 unless configured under the "*" key),
+    so rotating through made-up keys buys no extra share or budget.
+    """
+
+    def __init__(self, config: Optional[str] = None, default_weight: float = 1.0):
+        self.default_weight = default_weight
+        self._clients: Dict[str, ClientIdentity] = {}
+        self._anonymous = ClientIdentity("anonymous", default_weight)
+        for api_key, entry in json.loads(config or "{}").items():
+            priority = entry.get("priority", INTERACTIVE)
+            if priority not in PRIORITIES:
+                raise ValueError(f"Unknown priority {priority!r} for client {entry.get('name')}")
+            identity = ClientIdentity(
+                entry.get("name") or self._anonymous_id(api_key),
+                float(entry.get("weight", default_weight)),
+                priority,
+                entry.get("daily_token_budget"),
+            )
+            if api_key == "*":
+                identity.client_id = "anonymous"
+                self._anonymous = identity
+            else:
+                self._clients[api_key] = identity
+
+    @staticmethod
+    def _anonymous_id(api_key: str) -> str:
+        return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+    def clients(self):
+        return list(self._clients.values()) + [self._anonymous]
+
+    def identify(self, api_key: Optional[str], priority: Optional[str] = None) -> ClientIdentity:
+        """
+        Resolves the caller. `priority` (X-Priority header) can only lower
+        the configured class: an interactive client may mark a call as
+        batch, but a batch client cannot promote itself.
+        """
+        base = self._clients.get(api_key, self._anonymous) if api_key else self._anonymous
+        if priority == BATCH and base.priority == INTERACTIVE:
+            return base.with_priority(BATCH)
+        return base
+
+
+class _Waiter:
+    __slots__ = ("client", "cost", "finish", "seq", "enqueued_at")
+
+    def __init__(self, client: ClientIdentity, cost: int, finish: float, seq: int):
+        self.client = client
+        self.cost = cost
+        self.finish = finish
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+
+    def order(self):
+        return (PRIORITIES.index(self.client.priority), self.finish, self.seq)
+
+
+class FairScheduler:
+
+    def __init__(self, slots: int = 4, tokens_per_minute: Optional[int] = None):
+        self.slots = slots
+        self.tokens_per_minute = tokens_per_minute
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._waiting = []
+        self._running: Dict[str, int] = {}
+        self._weights: Dict[str, float] = {}
+        self._recent_tokens = deque()  # (timestamp, tokens)
+        self._client_stats: Dict[str, Dict[str, float]] = {}
+
+    # ---------- dispatch policy ----------
+
+    def _tokens_in_window_locked(self) -> int:
+        cutoff = time.monotonic() - 60
+        while self._recent_tokens and self._recent_tokens[0][0] < cutoff:
+            self._recent_tokens.popleft()
+        return sum(tokens for _, tokens in self._recent_tokens)
+
+    def _slot_share_locked(self, client_id: str) -> int:
+        active = {w.client.client_id for w in self._waiting} | {
+            cid for cid, n in self._running.items() if n
+        }
+        total = sum(self._weights[cid] for cid in active) or 1.0
+        return max(1, int(self.slots * self._weights[client_id] / total))
+
+    def _next_locked(self) -> Optional[_Waiter]:
+        if not self._waiting or sum(self._running.values()) >= self.slots:
+            return None
+        ordered = sorted(self._waiting, key=_Waiter.order)
+        chosen = next(
+            (
+                w for w in ordered
+                if self._running.get(w.client.client_id, 0) < self._slot_share_locked(w.client.client_id)
+            ),
+            ordered[0],
+        )
+        if self.tokens_per_minute and self._recent_tokens:
+            if self._tokens_in_window_locked() + chosen.cost > self.tokens_per_minute:
+                return None
+        return chosen
+
+    # ---------- public API ----------
+
+    @contextmanager
+    def slot(self, client: ClientIdentity, cost: int, deadline=None):
+        """
+        Waits for an upstream slot for `client`; `cost` is the estimated
+        tokens of the call (prompt + max completion).
+        """
+        with self._cond:
+            cid = client.client_id
+            self._weights[cid] = client.weight
+            start = max(self._virtual_time, self._last_finish.get(cid, 0.0))
+            waiter = _Waiter(client, cost, start + cost / client.weight, next(self._seq))
+            self._last_finish[cid] = waiter.finish
+            self._waiting.append(waiter)
+            stats = self._stats_locked(cid)
+
+            while self._next_locked() is not waiter:
+                if deadline is not None and deadline.expired():
+                    self._waiting.remove(waiter)
+                    self._cond.notify_all()
+                    deadline.check()
+                self._cond.wait(timeout=1.0)
+
+            self._waiting.remove(waiter)
+            self._running[cid] = self._running.get(cid, 0) + 1
+            self._virtual_time = max(self._virtual_time, start)
+            self._recent_tokens.append((time.monotonic(), cost))
+
+            waited = time.monotonic() - waiter.enqueued_at
+            stats["served"] += 1
+            stats["tokens"] += cost
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[cid] -= 1
+                self._cond.notify_all()
+
+    def _stats_locked(self, client_id: str) -> Dict[str, float]:
+        return self._client_stats.setdefault(
+            client_id, {"served": 0, "tokens": 0, "total_wait": 0.0, "max_wait": 0.0}
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per-client queue depth, running calls and wait times.
+        """
+        with self._cond:
+            clients = {}
+            for cid in sorted(set(self._client_stats) | set(self._running)):
+                stats = self._stats_locked(cid)
+                served = stats["served"]
+                clients[cid] = {
+                    "weight": self._weights.get(cid, 1.0),
+                    "queued": sum(1 for w in self._waiting if w.client.client_id == cid),
+                    "queued_interactive": sum(
+                        1 for w in self._waiting
+                        if w.client.client_id == cid and w.client.priority == INTERACTIVE
+                    ),
+                    "running": self._running.get(cid, 0),
+                    "served": served,
+                    "tokens": stats["tokens"],
+                    "avg_wait_seconds": round(stats["total_wait"] / served, 3) if served else 0.0,
+                    "max_wait_seconds": round(stats["max_wait"], 3),
+                }
+            return {
+                "slots": self.slots,
+                "tokens_per_minute": self.tokens_per_minute,
+                "tokens_last_minute": self._tokens_in_window_locked(),
+                "clients": clients,
+            }
@@ -0,0 +1,140 @@
+"""
+HTTP caching for itinerary representations.
+
+A stored itinerary never changes: its id is the hash of its validated
+content. Every representation of it (JSON, HTML, PDF, ...) therefore gets
+a strong ETag computed from the id, the format and the render options
+alone, so a matching If-None-Match is answered with 304 before anything
+is loaded or rendered. Text formats are compressed with brotli (if the
+optional `brotli` package is installed) or gzip, as the client accepts,
+and PDFs support single byte-range requests.
+"""
+
+import gzip
+import hashlib
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bump when the renderers change output, so clients stop revalidating
+# against entity tags for the old bytes.
+REPRESENTATION_VERSION = "1"
+
+COMPRESSIBLE_FORMATS = {"json", "html", "markdown", "ics"}
+
+# Bodies smaller than this are not worth compressing.
+MIN_COMPRESS_BYTES = 500
+
+
+def entity_tag(itinerary_id: str, fmt: str, *options, encoding: Optional[str] = None) -> str:
+    """
+    Strong ETag for one representation of a stored itinerary. Each
+    content-coding gets its own tag, as their bytes differ.
+    """
+    variant = hashlib.sha256(
+        repr((REPRESENTATION_VERSION, fmt) + options).encode("utf-8")
+    ).hexdigest()[:12]
+    tag = f"{itinerary_id[:32]}-{fmt}-{variant}"
+    if encoding:
+        tag += f"-{encoding}"
+    return f'"{tag}"'
+
+
+def _strip_encoding(tag: str) -> str:
+    for encoding in ("-gzip\"", "-br\""):
+        if tag.endswith(encoding):
+            return tag[: -len(encoding)] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match check (weak comparison, as RFC 9110 requires), ignoring
+    which content-coding the client's cached copy used.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = _strip_encoding(etag)
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if _strip_encoding(candidate) == wanted:
+            return True
+    return False
+
+
+def _accepted_codings(accept_encoding: str) -> List[Tuple[str, float]]:
+    codings = []
+    for part in accept_encoding.split(","):
+        pieces = [p.strip() for p in part.split(";")]
+        if not pieces[0]:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        codings.append((pieces[0].lower(), quality))
+    return codings
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    "br", "gzip", or None (identity) from an Accept-Encoding header.
+    Prefers brotli when it is installed and equally acceptable.
+    """
+    if not accept_encoding:
+        return None
+    qualities = dict(_accepted_codings(accept_encoding))
+    wildcard = qualities.get("*", 0.0)
+    available = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in available:
+        q = qualities.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single "bytes=" range, or None when the
+    whole body should be sent (no header, multiple ranges, other units).
+    Raises ValueError when the range cannot be satisfied (416).
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    first, last = (part.strip() for part in spec.split("-", 1))
+    if not first:
+        if not last.isdigit():
+            return None
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
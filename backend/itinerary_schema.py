@@ -62,4 +62,67 @@ def parse_and_validate_itinerary(raw_output: str) -> Dict[str, Any]:
             if key not in sections or not isinstance(sections[key], list):
                 raise ValueError(f"Section '{key}' must be a list")
 
-    return data
\ No newline at end of file
+    return data
+
+def get_shortlist_schema_prompt(max_candidates: int) -> str:
+    """
+    JSON schema for the discover-mode shortlist (stage one).
+    Kept tiny on purpose: names and one-line reasons only.
+    """
+    return f"""
+You MUST output valid JSON only.
+
+The JSON MUST follow this exact structure:
+
+{{
+  "candidates": [
+    {{
+      "rank": <integer starting from 1>,
+      "destination": <string, city/area and country>,
+      "reason": <string, one short sentence>
+    }}
+  ]
+}}
+
+Rules:
+- Return between 1 and {max_candidates} candidates, best first.
+- Do NOT plan any days or activities.
+- Do NOT include markdown or text outside JSON.
+- Output must be parseable by json.loads().
+"""
+
+def parse_and_validate_shortlist(raw_output: str, max_candidates: int) -> List[Dict[str, Any]]:
+    """
+    Parses the shortlist output and returns candidates ordered by rank.
+    Raises ValueError if invalid.
+    """
+    try:
+        data = json.loads(raw_output)
+    except json.JSONDecodeError as e:
+        raise ValueError("Model output is not valid JSON") from e
+
+    if not isinstance(data, dict) or not isinstance(data.get("candidates"), list):
+        raise ValueError("'candidates' must be a list")
+
+    candidates = []
+    for candidate in data["candidates"]:
+        if not isinstance(candidate, dict):
+            raise ValueError("Each candidate must be an object")
+        destination = candidate.get("destination")
+        if not isinstance(destination, str) or not destination.strip():
+            raise ValueError("Each candidate must have a 'destination'")
+        candidates.append({
+            "rank": candidate.get("rank", len(candidates) + 1),
+            "destination": destination.strip(),
+            "reason": candidate.get("reason", ""),
+        })
+
+    if not candidates:
+        raise ValueError("Shortlist is empty")
+
+    candidates.sort(key=lambda c: c["rank"] if isinstance(c["rank"], int) else len(candidates))
+    candidates = candidates[:max_candidates]
+    for position, candidate in enumerate(candidates, start=1):
+        candidate["rank"] = position
+
+    return candidates
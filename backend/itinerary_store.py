@@ -0,0 +1,253 @@
+"""
+Local storage of validated itineraries.
+
+Every itinerary that passes validation is stored in a small SQLite
+database, keyed by its content hash. While the model provider is
+unavailable (circuit open) the closest stored itinerary for the same
+destination is served instead, clearly flagged as such.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+def itinerary_id(itinerary: Dict[str, Any]) -> str:
+    """
+    Content hash of a validated itinerary (canonical JSON).
+    """
+    canonical = json.dumps(itinerary, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def normalize_destination(destination: Optional[str]) -> Optional[str]:
+    if not destination:
+        return None
+    text = re.sub(r"[^\w\s]", " ", destination.lower())
+    return " ".join(text.split()) or None
+
+
+class ItineraryStore:
+    """
+    Thread-safe SQLite store; one connection per thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS itineraries (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    trip_mode TEXT,
+                    destination_key TEXT,
+                    days INTEGER,
+                    schedule_style TEXT,
+                    itinerary_json TEXT NOT NULL,
+                    context_json TEXT
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_itineraries_destination "
+                "ON itineraries (destination_key, schedule_style, days)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS request_shapes (
+                    created_at REAL NOT NULL,
+                    destination TEXT NOT NULL,
+                    destination_key TEXT NOT NULL,
+                    days INTEGER NOT NULL,
+                    schedule_style TEXT,
+                    people INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS warm_itineraries (
+                    shape_key TEXT PRIMARY KEY,
+                    itinerary_id TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork() must not be used by the child.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def save(
+        self,
+        itinerary: Dict[str, Any],
+        context: Dict[str, Any],
+        destination: Optional[str],
+    ) -> str:
+        """
+        Stores a validated itinerary and returns its id.
+        `destination` is the place it was planned for (known destination
+        or the discover-mode pick); None if it is not known.
+        """
+        key = itinerary_id(itinerary)
+        with self.connection() as conn:
+            conn.execute(
+                """
+                INSERT OR IGNORE INTO itineraries
+                    (id, created_at, trip_mode, destination_key, days, schedule_style,
+                     itinerary_json, context_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    time.time(),
+                    context.get("trip_mode"),
+                    normalize_destination(destination),
+                    len(itinerary.get("days", [])),
+                    context.get("schedule_style"),
+                    json.dumps(itinerary),
+                    json.dumps(context),
+                ),
+            )
+        return key
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns {"itinerary": ..., "context": ...} for an id, or None.
+        """
+        row = self.connection().execute(
+            "SELECT itinerary_json, context_json FROM itineraries WHERE id = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "itinerary": json.loads(row["itinerary_json"]),
+            "context": json.loads(row["context_json"] or "{}"),
+        }
+
+    def missing(self, keys: List[str]) -> List[str]:
+        """
+        The ids in `keys` that are not stored, without loading any itinerary.
+        """
+        found = set()
+        conn = self.connection()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id FROM itineraries WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(row["id"] for row in rows)
+        return [key for key in keys if key not in found]
+
+    def closest(
+        self,
+        destination: Optional[str],
+        days: Optional[int],
+        schedule_style: Optional[str],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Closest stored itinerary for the same destination: same schedule
+        style first, then nearest day count, then most recent.
+        """
+        destination_key = normalize_destination(destination)
+        if destination_key is None:
+            return None
+        row = self.connection().execute(
+            """
+            SELECT id, days, schedule_style, itinerary_json FROM itineraries
+            WHERE destination_key = ?
+            ORDER BY (schedule_style IS ?) DESC, ABS(days - ?) ASC, created_at DESC
+            LIMIT 1
+            """,
+            (destination_key, schedule_style, days or 0),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "days": row["days"],
+            "schedule_style": row["schedule_style"],
+            "itinerary": json.loads(row["itinerary_json"]),
+        }
+
+    # ---------- Trip-shape history and pre-warmed itineraries ----------
+
+    @staticmethod
+    def shape_key(destination: str, days: int, schedule_style: Optional[str], people: int) -> str:
+        return json.dumps([normalize_destination(destination), days, schedule_style, people])
+
+    def record_request_shape(
+        self,
+        destination: str,
+        days: int,
+        schedule_style: Optional[str],
+        people: int,
+    ) -> None:
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO request_shapes VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), destination, normalize_destination(destination), days, schedule_style, people),
+            )
+
+    def top_request_shapes(self, limit: int, since: float) -> List[Dict[str, Any]]:
+        """
+        Most frequent (destination, days, schedule_style, people) shapes
+        requested since `since` (epoch seconds), most frequent first.
+        """
+        rows = self.connection().execute(
+            """
+            SELECT MAX(destination) AS destination, days, schedule_style, people, COUNT(*) AS requests
+            FROM request_shapes
+            WHERE created_at >= ?
+            GROUP BY destination_key, days, schedule_style, people
+            ORDER BY requests DESC
+            LIMIT ?
+            """,
+            (since, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_warm(self, shape_key: str, itinerary_id: str) -> None:
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO warm_itineraries (shape_key, itinerary_id, created_at) VALUES (?, ?, ?)",
+                (shape_key, itinerary_id, time.time()),
+            )
+
+    def warm_lookup(self, shape_key: str, max_age_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Warm entry for a shape; with `max_age_seconds`, entries older than
+        that are treated as missing.
+        """
+        oldest = time.time() - max_age_seconds if max_age_seconds is not None else 0
+        row = self.connection().execute(
+            """
+            SELECT w.itinerary_id, i.itinerary_json
+            FROM warm_itineraries w JOIN itineraries i ON i.id = w.itinerary_id
+            WHERE w.shape_key = ? AND w.created_at >= ?
+            """,
+            (shape_key, oldest),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["itinerary_id"],
+            "itinerary": json.loads(row["itinerary_json"]),
+        }
@@ -0,0 +1,304 @@
+"""
+Append-only token and cost ledger.
+
+One JSON line per request (and per background prefetch / pre-warm
+generation) with prompt and completion tokens, model, latency, retries and
+whether it was served from a cache. Entries go to one file per day
+(ledger-YYYY-MM-DD.jsonl next to the configured path), so startup only
+reads today's file. Once a day is over, its totals for every grouping are
+computed once and kept in a small ledger-YYYY-MM-DD.summary.json, and
+summaries read those instead of the raw lines. Per-client daily totals are
+kept in memory for cheap budget checks at admission time; they are brought
+up to date by reading whatever was appended to today's file since the last
+check, so entries written by other worker processes count too.
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+GROUP_BY_FIELDS = ("client", "trip_mode", "days", "weekday", "kind", "source", "model")
+
+# Response sources that did not require a fresh model generation.
+CACHE_SOURCES = {"warm_cache", "similar_request", "degraded_cache"}
+
+
+class BudgetExhausted(Exception):
+    """Raised when a client's daily token budget is already spent."""
+
+
+class CallUsage:
+    """
+    Accumulates usage over every upstream attempt made for one request.
+    Attempts cancelled mid-stream report no usage upstream, so their
+    tokens are estimated (~4 characters per token) and flagged.
+    """
+
+    def __init__(self):
+        self.model: Optional[str] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.attempts = 0
+        self.upstream_seconds = 0.0
+        self.estimated = False
+
+    def add_attempt(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        seconds: float,
+        estimated: bool = False,
+    ) -> None:
+        self.model = model
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.attempts += 1
+        self.upstream_seconds += seconds
+        self.estimated = self.estimated or estimated
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+# Summed per group; averages and rates are derived from these.
+SUM_FIELDS = (
+    "requests", "upstream_calls", "prompt_tokens", "completion_tokens",
+    "total_tokens", "retries", "cache_hits", "latency_seconds",
+)
+
+
+def _group_key(entry: Dict[str, Any], group_by: str) -> str:
+    if group_by == "weekday":
+        return WEEKDAYS[datetime.fromtimestamp(entry["ts"]).weekday()]
+    return str(entry.get(group_by))
+
+
+def _add_entry(g: Dict[str, float], entry: Dict[str, Any]) -> None:
+    g["requests"] += 1
+    g["upstream_calls"] += entry["upstream_calls"]
+    g["prompt_tokens"] += entry["prompt_tokens"]
+    g["completion_tokens"] += entry["completion_tokens"]
+    g["total_tokens"] += entry["total_tokens"]
+    g["retries"] += entry["retries"]
+    g["cache_hits"] += 1 if entry["cache_hit"] else 0
+    g["latency_seconds"] += entry["latency_seconds"]
+
+
+class TokenLedger:
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._stem, ext = os.path.splitext(path)
+        self._ext = ext or ".jsonl"
+        self._lock = threading.Lock()
+        self._today = date.today()
+        self._client_tokens_today: Dict[str, int] = defaultdict(int)
+        self._today_offset = 0  # bytes of today's file already counted
+        self._day_totals: Dict[date, Dict[str, Dict[str, Dict[str, float]]]] = {}
+        self._split_legacy_file()
+        with self._lock:
+            self._catch_up_locked()
+
+    def day_path(self, day: date) -> str:
+        return f"{self._stem}-{day.isoformat()}{self._ext}"
+
+    def _totals_path(self, day: date) -> str:
+        return f"{self._stem}-{day.isoformat()}.summary.json"
+
+    def _days(self) -> List[date]:
+        pattern = re.compile(re.escape(os.path.basename(self._stem)) + r"-(\d{4}-\d{2}-\d{2})" + re.escape(self._ext) + "$")
+        days = []
+        for name in glob.glob(f"{glob.escape(self._stem)}-*{self._ext}"):
+            match = pattern.match(os.path.basename(name))
+            if match:
+                days.append(date.fromisoformat(match.group(1)))
+        return sorted(days)
+
+    def _split_legacy_file(self) -> None:
+        """
+        One-off migration of a single ledger file written before daily
+        files: its lines are moved into the matching day files. The rename
+        makes sure only one worker does it.
+        """
+        if not os.path.exists(self.path):
+            return
+        claimed = f"{self.path}.migrating-{os.getpid()}"
+        try:
+            os.rename(self.path, claimed)
+        except OSError:
+            return
+        by_day: Dict[date, List[str]] = defaultdict(list)
+        for entry in self._entries(claimed):
+            by_day[date.fromtimestamp(entry["ts"])].append(json.dumps(entry) + "\n")
+        for day, lines in by_day.items():
+            with open(self.day_path(day), "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        os.remove(claimed)
+
+    def _catch_up_locked(self) -> None:
+        """
+        Counts the complete lines appended to today's file (by any
+        process) since the last call.
+        """
+        path = self.day_path(self._today)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size <= self._today_offset:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._today_offset)
+            data = f.read(size - self._today_offset)
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._client_tokens_today[entry["client"]] += entry["total_tokens"]
+        self._today_offset += complete
+
+    @staticmethod
+    def _entries(path: str, since: float = 0.0) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("ts", 0) >= since:
+                    yield entry
+
+    def record(
+        self,
+        kind: str,
+        client: str,
+        usage: CallUsage,
+        started: float,
+        source: str,
+        trip_mode: Optional[str] = None,
+        days: Optional[int] = None,
+        schedule_style: Optional[str] = None,
+    ) -> None:
+        """
+        Appends one entry; `started` is the time.time() the request began.
+        """
+        entry = {
+            "ts": round(time.time(), 3),
+            "kind": kind,
+            "client": client,
+            "trip_mode": trip_mode,
+            "days": days,
+            "schedule_style": schedule_style,
+            "model": usage.model,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+            "tokens_estimated": usage.estimated,
+            "retries": max(0, usage.attempts - 1),
+            "upstream_calls": usage.attempts,
+            "latency_seconds": round(time.time() - started, 3),
+            "source": source,
+            "cache_hit": source in CACHE_SOURCES,
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._roll_day_locked()
+            with open(self.day_path(self._today), "a", encoding="utf-8") as f:
+                f.write(line)
+            self._catch_up_locked()
+
+    def _roll_day_locked(self) -> None:
+        today = date.today()
+        if today != self._today:
+            self._today = today
+            self._client_tokens_today.clear()
+            self._today_offset = 0
+
+    def tokens_today(self, client: str) -> int:
+        with self._lock:
+            self._roll_day_locked()
+            self._catch_up_locked()
+            return self._client_tokens_today.get(client, 0)
+
+    def _closed_day_totals(self, day: date) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        {group_by: {group: sums}} for a finished day, computed from its
+        lines once and then read from the summary file.
+        """
+        totals = self._day_totals.get(day)
+        if totals is not None:
+            return totals
+        path = self._totals_path(day)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                totals = json.load(f)
+        else:
+            totals = {field: defaultdict(lambda: defaultdict(float)) for field in GROUP_BY_FIELDS}
+            for entry in self._entries(self.day_path(day)):
+                for field in GROUP_BY_FIELDS:
+                    _add_entry(totals[field][_group_key(entry, field)], entry)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(totals, f)
+            os.replace(tmp, path)
+        self._day_totals[day] = totals
+        return totals
+
+    def summary(self, group_by: str, since: float = 0.0) -> Dict[str, Any]:
+        """
+        Totals per group: requests, upstream calls, tokens, latency,
+        retries and cache-hit rate. Finished days whole inside the window
+        come from their stored totals; only today and the day `since`
+        falls in are read line by line.
+        """
+        if group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY_FIELDS)}")
+
+        today = date.today()
+        first_day = date.fromtimestamp(since) if since else None
+        starts_mid_day = since and since > datetime.combine(first_day, datetime.min.time()).timestamp()
+
+        groups: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for day in self._days():
+            if first_day is not None and day < first_day:
+                continue
+            if day < today and not (day == first_day and starts_mid_day):
+                for key, sums in self._closed_day_totals(day)[group_by].items():
+                    for field in SUM_FIELDS:
+                        groups[key][field] += sums.get(field, 0)
+            else:
+                for entry in self._entries(self.day_path(day), since):
+                    _add_entry(groups[_group_key(entry, group_by)], entry)
+
+        result = {}
+        for key, g in sorted(groups.items(), key=lambda item: -item[1]["total_tokens"]):
+            requests = g["requests"]
+            result[key] = {
+                "requests": int(requests),
+                "upstream_calls": int(g["upstream_calls"]),
+                "prompt_tokens": int(g["prompt_tokens"]),
+                "completion_tokens": int(g["completion_tokens"]),
+                "total_tokens": int(g["total_tokens"]),
+                "avg_tokens_per_request": round(g["total_tokens"] / requests, 1),
+                "retries": int(g["retries"]),
+                "cache_hit_rate": round(g["cache_hits"] / requests, 4),
+                "avg_latency_seconds": round(g["latency_seconds"] / requests, 3),
+            }
+        return {"group_by": group_by, "groups": result}
@@ -1,18 +1,254 @@
 import os
-from typing import Optional, List, Literal, Any, Dict
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional, List, Literal, Any, Dict, Tuple
+from functools import partial
+import anyio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from pydantic import BaseModel, Field, PrivateAttr
 from dotenv import load_dotenv
-from openai import OpenAI
-from .itinerary_schema import get_itinerary_schema_prompt, parse_and_validate_itinerary
-from .pdf_generator import generate_itinerary_pdf
-from datetime import datetime
+from .itinerary_schema import (
+    get_itinerary_schema_prompt,
+    parse_and_validate_itinerary,
+    get_shortlist_schema_prompt,
+    parse_and_validate_shortlist,
+)
+from .discovery import build_shortlist_prompt, ShortlistPrefetcher
+from .token_budget import TokenBudgeter
+from .stream_validator import StreamingItineraryValidator, StreamAbortStats, consume_choices
+from .admission import AdmissionController, Deadline, DeadlineExceeded, OverloadedError, RenderCancelled
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .itinerary_store import ItineraryStore
+from .similarity import SimilarityIndex
+from .fair_scheduler import BATCH, ClientIdentity, ClientRegistry, FairScheduler
+from .prewarm import PrewarmJob
+from .ledger import BudgetExhausted, CallUsage, TokenLedger
+from .renderers import FILE_EXTENSIONS, MEDIA_TYPES, RenderCache, negotiate_format, render
+from .http_cache import (
+    COMPRESSIBLE_FORMATS,
+    MIN_COMPRESS_BYTES,
+    compress,
+    entity_tag,
+    etag_matches,
+    negotiate_encoding,
+    parse_range,
+)
+from .warmup import WarmUp
+from .model_router import ModelRouter, Route, attempt_routes, load_routes
+from .shared_cache import LeaderLock, SharedCache
+from .trip_dates import (
+    DateParseError,
+    TripSchedule,
+    describe_dates,
+    describe_windows,
+    format_date_range,
+    format_time_constraints,
+    parse_date_range,
+    trip_schedule,
+)
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, JSONResponse
+from datetime import date, datetime, timedelta
 
 load_dotenv()
 
-app = FastAPI(title="AI Trip Itinerary Generator")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ENABLED:
+        warmup.start()
+    # With several workers only the one holding the lock pre-warms.
+    if PREWARM_ENABLED and prewarm_leader.acquire():
+        prewarm_job.start()
+    yield
+    prewarm_job.stop()
+    prewarm_leader.release()
+    if isinstance(render_cache, SharedCache):
+        render_cache.flush()
+
+app = FastAPI(title="AI Trip Itinerary Generator", lifespan=lifespan)
+
+# The OpenAI SDK and reportlab are slow to import, so neither is loaded at
+# import time: the client is built by get_client() on first use, the PDF
+# modules are imported where they are used, and both are loaded early by
+# the background warm-up (GET /ready).
+#
+# Clients are per process: one inherited across fork() (e.g. a preloading
+# process manager) shares its connection pool with the parent, so it is
+# rebuilt in the child. SDK retries are off: the router and circuit breaker
+# decide on retries, and hidden ones would run past the request deadline.
+client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    This worker's OpenAI client, built on first use.
+    """
+    global client, _client_pid
+    if client is None or _client_pid not in (None, os.getpid()):
+        with _client_lock:
+            if client is None or _client_pid not in (None, os.getpid()):
+                from openai import OpenAI
+
+                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+                _client_pid = os.getpid()
+    return client
+
+
+def warm_pdf_stack() -> None:
+    from .booklet import generate_booklet_pdf  # noqa: F401 (imports pdf_generator too)
+    from .pdf_generator import itinerary_styles
+
+    itinerary_styles()
+
+
+# Load the model client and PDF stack in the background after startup.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+warmup = WarmUp([
+    ("openai_client", get_client),
+    ("pdf_stack", warm_pdf_stack),
+])
+
+# Model routes, weakest to strongest (see model_router.py); built-in
+# defaults when the file does not exist.
+MODEL_ROUTES_PATH = os.getenv("MODEL_ROUTES_PATH", "model_routes.json")
+router = ModelRouter(load_routes(MODEL_ROUTES_PATH))
+_route_clients: Dict[Any, Any] = {}
+
+
+def client_for(route: Route):
+    """
+    The client for a route: the shared one, or a separate client for
+    routes that point at another OpenAI-compatible server.
+    """
+    if route.base_url is None and route.api_key_env is None:
+        return get_client()
+    key = (route.base_url, route.api_key_env, os.getpid())
+    with _client_lock:
+        if key not in _route_clients:
+            from openai import OpenAI
+
+            _route_clients[key] = OpenAI(
+                api_key=os.getenv(route.api_key_env or "OPENAI_API_KEY"),
+                base_url=route.base_url,
+                max_retries=0,
+            )
+        return _route_clients[key]
+
+# Discover mode, stage one: how many candidates to rank and how much to spend.
+SHORTLIST_SIZE = int(os.getenv("SHORTLIST_SIZE", "3"))
+SHORTLIST_MAX_TOKENS = int(os.getenv("SHORTLIST_MAX_TOKENS", "250"))
+
+ANONYMOUS_CLIENT = ClientIdentity("anonymous")
+
+# Worker processes on this node (uvicorn's --workers defaults to this too).
+# Concurrency, queue and upstream limits below are node-wide totals, split
+# evenly so N workers together stay within them.
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def per_worker(total: int) -> int:
+    return max(1, total // WORKERS)
+
+
+# Overload protection. MAX_CONCURRENT + MAX_QUEUED should stay below the
+# threadpool size (40 by default) so queued requests never block the pool.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+
+admission = AdmissionController(
+    max_concurrent=per_worker(int(os.getenv("MAX_CONCURRENT_GENERATIONS", "8"))),
+    max_queue=per_worker(int(os.getenv("MAX_QUEUED_GENERATIONS", "32"))),
+    max_wait_seconds=float(os.getenv("MAX_QUEUE_WAIT_SECONDS", "30")),
+    max_queue_per_client=per_worker(int(os.getenv("MAX_QUEUED_PER_CLIENT", "8"))),
+)
+
+itinerary_store = ItineraryStore(os.getenv("ITINERARY_DB_PATH", "generated_data/itineraries.db"))
+
+# Multi-worker mode: caches live in the store's database, shared by every
+# worker on the node, instead of one in-process copy per worker.
+SHARED_CACHE = os.getenv("SHARED_CACHE", "true").lower() == "true"
+
+# Fail fast while the model provider is down; serve stored itineraries instead.
+breaker = CircuitBreaker(
+    window=int(os.getenv("BREAKER_WINDOW", "20")),
+    min_calls=int(os.getenv("BREAKER_MIN_CALLS", "5")),
+    error_rate_threshold=float(os.getenv("BREAKER_ERROR_RATE", "0.5")),
+    slow_call_seconds=float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "30")),
+    slow_rate_threshold=float(os.getenv("BREAKER_SLOW_RATE", "0.5")),
+    open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+    shared=SharedCache(itinerary_store, "breaker") if SHARED_CACHE else None,
+)
+
+# A pick whose prefetch is still running waits at most this long, and at
+# most this share of the request's remaining deadline, so normal
+# generation still has time if the prefetch is not ready.
+PREFETCH_MAX_WAIT_SECONDS = float(os.getenv("PREFETCH_MAX_WAIT_SECONDS", "5"))
+PREFETCH_WAIT_SHARE = float(os.getenv("PREFETCH_WAIT_SHARE", "0.25"))
+
+prefetcher = ShortlistPrefetcher(
+    shared=SharedCache(itinerary_store, "prefetch", ttl_seconds=900) if SHARED_CACHE else None,
+)
+
+# Near-duplicate reuse: identical structured answers + similar free text.
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "true").lower() == "true"
+
+similarity_index = SimilarityIndex(
+    itinerary_store,
+    threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.8")),
+)
+
+# Weighted fair sharing of upstream slots/tokens across API clients (X-API-Key).
+client_registry = ClientRegistry(os.getenv("CLIENT_CONFIG"))
+
+UPSTREAM_TOKENS_PER_MINUTE = int(os.getenv("UPSTREAM_TOKENS_PER_MINUTE", "0"))
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+scheduler = FairScheduler(
+    slots=per_worker(int(os.getenv("UPSTREAM_SLOTS", "4"))),
+    tokens_per_minute=per_worker(UPSTREAM_TOKENS_PER_MINUTE) if UPSTREAM_TOKENS_PER_MINUTE else None,
+)
+
+PREWARM_CLIENT = ClientIdentity("prewarm", priority=BATCH)
+
+# Off-peak pre-warming of the most requested known-destination trip shapes.
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "false").lower() == "true"
+prewarm_leader = LeaderLock(os.getenv("PREWARM_LOCK_PATH", "generated_data/prewarm.lock"))
+
+# Append-only record of tokens, latency and cache status for every request.
+ledger = TokenLedger(os.getenv("LEDGER_PATH", "generated_data/ledger.jsonl"))
+
+# Lightweight renders (HTML/Markdown/iCalendar, on-demand PDF), cached per itinerary.
+RENDER_CACHE_BYTES = int(os.getenv("RENDER_CACHE_BYTES", str(64 * 1024 * 1024)))
+render_cache = (
+    SharedCache(itinerary_store, "render", max_bytes=RENDER_CACHE_BYTES)
+    if SHARED_CACHE else RenderCache(max_bytes=RENDER_CACHE_BYTES)
+)
+
+# Write a PDF to generated_pdfs/ for every generated itinerary. When false,
+# PDFs are only rendered on request (Accept: application/pdf).
+EAGER_PDF = os.getenv("EAGER_PDF", "true").lower() == "true"
+
+# How long clients may reuse a stored itinerary representation without
+# revalidating (its content never changes for a given id).
+ITINERARY_CACHE_MAX_AGE = int(os.getenv("ITINERARY_CACHE_MAX_AGE", "86400"))
+
+# Largest number of stored itineraries one booklet PDF may combine.
+BOOKLET_MAX_ITINERARIES = int(os.getenv("BOOKLET_MAX_ITINERARIES", "1000"))
+
+# How many times a structurally invalid (cancelled) generation is retried.
+STREAM_MAX_RETRIES = int(os.getenv("STREAM_MAX_RETRIES", "1"))
+
+# Most alternative itineraries one request may ask for (`variants`).
+MAX_ITINERARY_VARIANTS = int(os.getenv("MAX_ITINERARY_VARIANTS", "4"))
+
+stream_stats = StreamAbortStats()
+
+token_budgeter = TokenBudgeter(
+    history_path=os.getenv("TOKEN_HISTORY_PATH", "generated_data/token_usage.jsonl")
+)
 
 # ---------- Models ----------
 
@@ -112,8 +348,44 @@ class TripContext(BaseModel):
 
     additional_notes: Optional[str] = None  # Q40 / B31
 
+    # =====================================================
+    # ============ DISCOVER SHORTLIST (TWO-STAGE) =========
+    # =====================================================
+
+    prefetch_top_candidate: Optional[bool] = None  # start planning the #1 candidate early
+    shortlist_id: Optional[str] = None  # from /discover-shortlist
+    selected_destination: Optional[str] = None  # candidate picked from the shortlist
+
+    # =====================================================
+    # ================= GENERATION OPTIONS ================
+    # =====================================================
+
+    variants: Optional[int] = None  # alternative itineraries from one upstream call
+
+    # Parsed dates, set by preflight_trip_dates so the prompt does not parse them again.
+    _schedule: Optional[TripSchedule] = PrivateAttr(default=None)
+
+class ItineraryVariant(BaseModel):
+    itinerary: Dict[str, Any]
+    itinerary_id: str
+    pdf_url: str  # rendered on first request
+
 class TripResponse(BaseModel):
     itinerary: Dict[str, Any]
+    itinerary_id: Optional[str] = None  # GET /itineraries/{itinerary_id} for other formats
+    source: str = "generated"  # "generated", "warm_cache", "similar_request", "degraded_cache" or "stored"
+    notice: Optional[str] = None  # set when the itinerary was not freshly generated
+    adjustments: Optional[List[str]] = None  # input normalizations applied before planning
+    alternatives: Optional[List[ItineraryVariant]] = None  # other valid variants, when variants > 1
+
+class ShortlistResponse(BaseModel):
+    shortlist_id: str
+    candidates: List[Dict[str, Any]]
+
+class BookletRequest(BaseModel):
+    itinerary_ids: List[str]
+    title: str = "Travel Itineraries"
+    entry_titles: Optional[List[str]] = None  # e.g. client names; defaults to destination + length
 
 # ---------- Prompt ----------
 
@@ -147,6 +419,22 @@ def build_prompt(ctx: TripContext) -> str:
     if ctx.end_time_preference == "Other" and ctx.end_time_other_text:
         end_time_display = ctx.end_time_other_text
 
+    # Dates and time windows arrive already parsed by preflight_trip_dates.
+    schedule = ctx._schedule
+    if schedule is None:
+        try:
+            schedule = context_schedule(ctx)
+        except DateParseError:
+            schedule = TripSchedule()
+
+    dates_display = ctx.date_range or "Not specified"
+    if schedule.start_date is not None:
+        dates_display = describe_dates(schedule)
+
+    time_constraints_display = ctx.time_constraints_detail or "None"
+    if schedule.windows:
+        time_constraints_display = describe_windows(schedule)
+
     # ==========================================
     # Destination Block
     # ==========================================
@@ -176,9 +464,14 @@ Transportation mode to destination: {ctx.transport_mode}
 {travel_scope}
 
 Has specific dates: {ctx.has_dates}
-Date range (if known): {ctx.date_range or "Not specified"}
+Date range (if known): {dates_display}
 
 Planned trip structure (one area vs multiple areas): {ctx.area_structure}
+"""
+
+        if ctx.selected_destination:
+            destination_block += f"""
+Selected destination (chosen by the user from a shortlist; plan ONLY for this destination): {ctx.selected_destination}
 """
 
     else:
@@ -186,6 +479,10 @@ Planned trip structure (one area vs multiple areas): {ctx.area_structure}
 Trip mode: Known destination (Option B)
 
 Destination details (including dates if provided): {ctx.destination}
+"""
+        if schedule.start_date is not None:
+            destination_block += f"""
+Trip dates: {dates_display}
 """
 
     # ==========================================
@@ -205,7 +502,7 @@ Trip length (days): {ctx.days or "Not specified"}
 Number of people: {ctx.people}
 
 Has strict time constraints: {ctx.has_time_constraints}
-Time constraint details: {ctx.time_constraints_detail or "None"}
+Time constraint details: {time_constraints_display}
 
 Special group considerations: {ctx.special_group_needs}
 Accessibility needs: {ctx.accessibility_needs}
@@ -624,16 +921,17 @@ Before finalizing:
 ------------------------------------------------------------
 FORMAT:
 
-Day 1:
-Morning:
-Afternoon:
-Evening:
+Return the itinerary ONLY as the JSON object described below.
+Each day's Morning, Afternoon and Evening blocks go in that day's "sections" object.
 """.strip()
 
-# ---------- Endpoint ----------
+# ---------- Validation ----------
 
-@app.post("/generate-itinerary", response_model=TripResponse)
-def generate_itinerary(ctx: TripContext):
+def validate_trip_context(ctx: TripContext) -> None:
+    """
+    Checks the questionnaire answers for consistency.
+    Raises HTTPException(400) on the first invalid field.
+    """
 
     # =====================================================
     # 1) Trip mode validation
@@ -773,6 +1071,7 @@ def generate_itinerary(ctx: TripContext):
             )
 
     validate_range(ctx.days, 1, 30, "days")
+    validate_range(ctx.variants, 1, MAX_ITINERARY_VARIANTS, "variants")
     validate_range(ctx.food_interest_level, 1, 10, "food_interest_level")
     validate_range(ctx.shopping_interest_level, 1, 10, "shopping_interest_level")
     validate_range(ctx.physical_activity_level, 1, 10, "physical_activity_level")
@@ -780,35 +1079,1215 @@ def generate_itinerary(ctx: TripContext):
     validate_range(ctx.photography_importance, 1, 10, "photography_importance")
 
     # =====================================================
-    # 7) Prompt + Model Call
+    # 7) Shortlist selection (discover mode only)
     # =====================================================
+    if ctx.selected_destination and ctx.trip_mode != "discover":
+        raise HTTPException(
+            400,
+            "selected_destination is only supported for trip_mode='discover'"
+        )
+
+    if ctx.shortlist_id and not ctx.selected_destination:
+        raise HTTPException(
+            400,
+            "selected_destination is required when shortlist_id is provided"
+        )
+
+
+def context_schedule(ctx: TripContext) -> TripSchedule:
+    return trip_schedule(
+        ctx.date_range if ctx.has_dates else None,
+        ctx.time_constraints_detail if ctx.has_time_constraints else None,
+        ctx.days,
+    )
+
+
+def stored_start_date(context: Dict[str, Any]) -> Optional[date]:
+    """
+    First day of a stored request's date_range, or None without dates.
+    Stored ranges are canonical (explicit years), so a trip that has
+    already happened keeps its own dates.
+    """
+    if not (context.get("has_dates") and context.get("date_range")):
+        return None
+    try:
+        return parse_date_range(context["date_range"], today=date.min)[0]
+    except DateParseError:
+        return None
+
+
+def preflight_trip_dates(ctx: TripContext) -> Tuple[TripContext, TripSchedule]:
+    """
+    Parses date_range and time_constraints_detail locally, before any
+    model call. Returns the context with canonical date text and the day
+    count the date range implies (date_range wins over a conflicting
+    days), plus the parsed schedule. Raises HTTPException(400) when the
+    dates are malformed or contradict each other.
+    """
+    try:
+        schedule = context_schedule(ctx)
+    except DateParseError as e:
+        raise HTTPException(400, str(e))
+
+    updates: Dict[str, Any] = {}
+    if schedule.start_date is not None:
+        updates["date_range"] = format_date_range(schedule.start_date, schedule.end_date)
+        updates["days"] = schedule.days
+    if schedule.windows:
+        updates["time_constraints_detail"] = format_time_constraints(schedule.windows)
+    ctx = ctx.model_copy(update=updates)
+    ctx._schedule = schedule
+    return ctx, schedule
+
+# ---------- Model Calls ----------
+
+def call_upstream(fn, deadline: Optional[Deadline] = None):
+    """
+    Runs one upstream model call through the circuit breaker.
+
+    Provider errors and timeouts longer than the slow-call threshold count
+    as failures; calls cut short by the caller's own deadline or disconnect
+    say nothing about provider health and are ignored.
+    """
+    from openai import APIError, APITimeoutError
+
+    # Never send a call with no time left (a timeout of 0 or less).
+    if deadline is not None:
+        deadline.check()
+    breaker.before_call()
+    started = time.monotonic()
+    try:
+        result = fn()
+    except APITimeoutError as e:
+        if time.monotonic() - started >= breaker.slow_call_seconds:
+            breaker.record_failure()
+        else:
+            breaker.record_ignored()
+        raise DeadlineExceeded("Upstream call exceeded the request deadline") from e
+    except APIError:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.record_ignored()
+        raise
+
+    if deadline is not None and deadline.expired():
+        breaker.record_ignored()
+        deadline.check()
+
+    breaker.record_success(time.monotonic() - started)
+    return result
+
+
+def request_itinerary(
+    ctx: TripContext,
+    deadline: Optional[Deadline] = None,
+    client_identity: Optional[ClientIdentity] = None,
+    usage: Optional[CallUsage] = None,
+    latency_target: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Runs the full day-by-day generation for a validated context.
+    See request_itineraries.
+    """
+    return request_itineraries(ctx, deadline, client_identity, usage, latency_target)[0]
+
+
+def request_itineraries(
+    ctx: TripContext,
+    deadline: Optional[Deadline] = None,
+    client_identity: Optional[ClientIdentity] = None,
+    usage: Optional[CallUsage] = None,
+    latency_target: Optional[float] = None,
+    variants: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Runs the full day-by-day generation for a validated context and
+    returns the valid itineraries (at least one).
+
+    The completion is streamed through a structural validator; output that
+    can no longer become a valid itinerary is cancelled immediately and
+    retried instead of being waited out and rejected by json.loads.
+    The optional deadline caps the upstream timeout and cancels the stream
+    once it expires or the client disconnects. Each attempt waits for an
+    upstream slot in the fair scheduler on behalf of client_identity, and
+    its token usage is added to `usage` for the ledger.
+
+    The model router picks the model from the trip's complexity and the
+    optional latency target (seconds); a failed or invalid attempt is
+    retried on the next stronger route.
+
+    variants > 1 asks for that many choices in the same upstream call, so
+    the prompt is sent and billed once. Invalid choices are dropped; the
+    attempt only fails (and is retried) when none of them is valid.
+    """
+    from openai import APIError
+
     prompt = build_prompt(ctx) + "\n\n" + get_itinerary_schema_prompt()
+    messages = [
+        {"role": "system", "content": "You generate realistic, practical travel itineraries."},
+        {"role": "user", "content": prompt},
+    ]
 
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You generate realistic, practical travel itineraries."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.7,
-        max_tokens=1200,
+    expected_tokens = int(
+        token_budgeter.predict(ctx.days, ctx.schedule_style, ctx.trip_mode) / token_budgeter.safety_margin
     )
+    routes = router.plan(ctx.model_dump(exclude_none=True, exclude={"variants"}), expected_tokens, latency_target)
+    attempts = attempt_routes(routes, STREAM_MAX_RETRIES + 1)
+
+    for attempt, route in enumerate(attempts):
+        if deadline is not None:
+            deadline.check()
+
+        escalated = attempt > 0 and route is not attempts[attempt - 1]
+        max_tokens = token_budgeter.predict(ctx.days, ctx.schedule_style, ctx.trip_mode)
+        validators = [StreamingItineraryValidator() for _ in range(variants)]
+
+        def stream_attempt():
+            extra = {"n": variants} if variants > 1 else {}
+            stream = client_for(route).chat.completions.create(
+                model=route.model,
+                messages=messages,
+                temperature=route.temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=deadline.remaining() if deadline is not None else None,
+                **extra,
+            )
+            return consume_choices(
+                stream,
+                validators,
+                should_stop=deadline.expired if deadline is not None else None,
+            )
+
+        # max_tokens applies to each choice.
+        cost = max_tokens * variants + len(prompt) // 4
+        with scheduler.slot(client_identity or ANONYMOUS_CLIENT, cost, deadline):
+            attempt_started = time.monotonic()
+            try:
+                results, result_usage = call_upstream(stream_attempt, deadline)
+            except APIError:
+                router.record(route, time.monotonic() - attempt_started, ok=False, escalated=escalated)
+                if attempt == STREAM_MAX_RETRIES or route is routes[-1]:
+                    raise
+                continue
+
+        if usage is not None:
+            if result_usage is not None:
+                usage.add_attempt(
+                    route.model,
+                    result_usage.prompt_tokens,
+                    result_usage.completion_tokens,
+                    time.monotonic() - attempt_started,
+                )
+            else:
+                usage.add_attempt(
+                    route.model,
+                    len(prompt) // 4,
+                    sum(result.chars for result in results) // 4,
+                    time.monotonic() - attempt_started,
+                    estimated=True,
+                )
+
+        itineraries = []
+        errors = []
+        for result, validator in zip(results, validators):
+            error = result.error
+            if error is None:
+                try:
+                    itineraries.append(parse_and_validate_itinerary(result.text))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                errors.append(error)
+            # Savings estimates only hold for single-choice streams: an
+            # invalid choice among several keeps generating upstream.
+            if variants == 1:
+                stream_stats.record(
+                    result,
+                    expected_tokens=int(max_tokens / token_budgeter.safety_margin),
+                    repaired=validator.fenced and error is None,
+                )
+
+        # Usage is reported for the whole completion, not per choice.
+        completion_tokens = None
+        if result_usage is not None:
+            completion_tokens = result_usage.completion_tokens // variants
+            if variants == 1:
+                token_budgeter.record(
+                    ctx.days,
+                    ctx.schedule_style,
+                    ctx.trip_mode,
+                    max_tokens,
+                    completion_tokens,
+                    results[0].finish_reason,
+                )
+
+        router.record(
+            route,
+            time.monotonic() - attempt_started,
+            ok=bool(itineraries),
+            completion_tokens=completion_tokens,
+            escalated=escalated,
+        )
+        if itineraries:
+            return itineraries
+
+        error = errors[0]
+        if attempt < STREAM_MAX_RETRIES:
+            stream_stats.record_retry()
+            messages = messages[:2] + [
+                {"role": "system", "content": "Output the JSON object only, starting with '{'. No prose, headings or markdown."},
+            ]
+
+    raise ValueError(f"Model output is not a valid itinerary: {error}")
+
+
+def request_shortlist(
+    ctx: TripContext,
+    deadline: Optional[Deadline] = None,
+    client_identity: Optional[ClientIdentity] = None,
+    usage: Optional[CallUsage] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Asks for a short ranked list of candidate destinations.
+    Uses a tiny token budget; no day-by-day planning happens here.
+    """
+    prompt = build_shortlist_prompt(ctx) + "\n\n" + get_shortlist_schema_prompt(SHORTLIST_SIZE)
+
+    # Ranking a few candidates is easy; always use the lightest route.
+    route = router.routes[0]
+
+    if deadline is not None:
+        deadline.check()
+
+    cost = SHORTLIST_MAX_TOKENS + len(prompt) // 4
+    with scheduler.slot(client_identity or ANONYMOUS_CLIENT, cost, deadline):
+        attempt_started = time.monotonic()
+        completion = call_upstream(
+            lambda: client_for(route).chat.completions.create(
+                model=route.model,
+                messages=[
+                    {"role": "system", "content": "You shortlist realistic travel destinations."},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=route.temperature,
+                max_tokens=SHORTLIST_MAX_TOKENS,
+                timeout=deadline.remaining() if deadline is not None else None,
+            ),
+            deadline,
+        )
+
+    if usage is not None and completion.usage is not None:
+        usage.add_attempt(
+            route.model,
+            completion.usage.prompt_tokens,
+            completion.usage.completion_tokens,
+            time.monotonic() - attempt_started,
+        )
 
     raw_output = completion.choices[0].message.content
 
-    validated_itinerary = parse_and_validate_itinerary(raw_output)
+    return parse_and_validate_shortlist(raw_output, SHORTLIST_SIZE)
+
+# ---------- Request Execution ----------
+
+def request_deadline_seconds(request: Request) -> float:
+    """
+    Per-request deadline: X-Request-Timeout (seconds) if the client sent
+    one, capped at REQUEST_DEADLINE_SECONDS.
+    """
+    header = request.headers.get("x-request-timeout")
+    if header is None:
+        return REQUEST_DEADLINE_SECONDS
+    try:
+        seconds = float(header)
+    except ValueError:
+        raise HTTPException(400, "X-Request-Timeout must be a number of seconds")
+    if seconds <= 0:
+        raise HTTPException(400, "X-Request-Timeout must be positive")
+    return min(seconds, REQUEST_DEADLINE_SECONDS)
+
+
+def request_latency_target(request: Request) -> Optional[float]:
+    """
+    Optional X-Latency-Target (seconds): how long the client would like
+    generation to take. The router trades model strength for speed to
+    meet it; unlike X-Request-Timeout it is a preference, not a limit.
+    """
+    header = request.headers.get("x-latency-target")
+    if header is None:
+        return None
+    try:
+        seconds = float(header)
+    except ValueError:
+        raise HTTPException(400, "X-Latency-Target must be a number of seconds")
+    if seconds <= 0:
+        raise HTTPException(400, "X-Latency-Target must be positive")
+    return seconds
+
+
+def daily_budget_spent(client_identity: ClientIdentity) -> bool:
+    budget = client_identity.daily_token_budget
+    return budget is not None and ledger.tokens_today(client_identity.client_id) >= budget
+
+
+def run_background(fn, client_identity: ClientIdentity, *args):
+    """
+    Runs fn(*args, deadline, client_identity) in the calling background
+    thread (prefetch, pre-warm) under the same limits as a request: the
+    client's daily token budget, admission control and a deadline.
+
+    Background work only takes an idle execution slot, so it never queues
+    ahead of requests; raises BudgetExhausted or OverloadedError instead.
+    """
+    if daily_budget_spent(client_identity):
+        raise BudgetExhausted(client_identity.client_id)
+    deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+    admission.reserve(client_identity, max_wait_seconds=0)
+    with admission.slot(client_identity, deadline):
+        return fn(*args, deadline, client_identity)
+
+
+async def run_admitted(request: Request, fn, *args):
+    """
+    Runs fn(*args, deadline, client_identity) in the threadpool under
+    admission control.
+
+    Rejects clients over their daily token budget with 429, sheds the
+    request with 503 + Retry-After before it takes a thread if the queue
+    is full or the estimated wait is too long, and cancels the
+    deadline (which stops the upstream stream) if the client disconnects.
+    """
+    deadline = Deadline(request_deadline_seconds(request))
+    client_identity = client_registry.identify(
+        request.headers.get("x-api-key"), request.headers.get("x-priority")
+    )
+
+    if daily_budget_spent(client_identity):
+        tomorrow = datetime.combine(datetime.now().date(), datetime.min.time()).timestamp() + 86400
+        raise HTTPException(
+            429,
+            "Daily token budget exhausted for this API key",
+            headers={"Retry-After": str(max(1, int(tomorrow - time.time())))},
+        )
+
+    try:
+        admission.reserve(client_identity)
+    except OverloadedError as e:
+        raise HTTPException(
+            503,
+            "Server is busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    def run():
+        # Exceptions are handed back as values so they are not wrapped in
+        # the task group's ExceptionGroup.
+        try:
+            with admission.slot(client_identity, deadline):
+                return fn(*args, deadline, client_identity), None
+        except Exception as e:
+            return None, e
+
+    async def watch_disconnect():
+        while not deadline.expired():
+            if await request.is_disconnected():
+                deadline.cancel()
+                return
+            await anyio.sleep(0.5)
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(watch_disconnect)
+        result, error = await anyio.to_thread.run_sync(run)
+        tg.cancel_scope.cancel()
+
+    if isinstance(error, RenderCancelled):
+        # reportlab prefixes its own context to the message
+        raise HTTPException(504, "Request deadline exceeded while rendering")
+    if isinstance(error, DeadlineExceeded):
+        raise HTTPException(504, str(error) or "Request deadline exceeded")
+    if isinstance(error, CircuitOpenError):
+        raise HTTPException(
+            503,
+            "Itinerary generation is temporarily unavailable",
+            headers={"Retry-After": str(error.retry_after)},
+        )
+    if error is not None:
+        raise error
+    return result
+
+
+def planned_destination(ctx: TripContext) -> Optional[str]:
+    """
+    The place an itinerary is planned for, if known before generation.
+    """
+    return ctx.destination if ctx.trip_mode == "known" else ctx.selected_destination
+
+
+def degraded_itinerary(ctx: TripContext):
+    """
+    Closest stored itinerary for the same destination, trimmed to the
+    requested day count. Returns (itinerary, notice) or None.
+    """
+    match = itinerary_store.closest(planned_destination(ctx), ctx.days, ctx.schedule_style)
+    if match is None:
+        return None
+
+    itinerary = match["itinerary"]
+    if ctx.days and len(itinerary["days"]) > ctx.days:
+        itinerary = {**itinerary, "days": itinerary["days"][:ctx.days]}
+
+    notice = (
+        "Itinerary generation is temporarily unavailable. This is a previously "
+        f"generated itinerary for {ctx.days and min(ctx.days, match['days']) or match['days']} day(s) in the same destination "
+        f"(schedule style: {match['schedule_style'] or 'Not specified'}) and was not tailored to this request."
+    )
+    return itinerary, notice
+
+
+def warm_shape_context(destination: str, days: int, schedule_style: Optional[str], people: int) -> TripContext:
+    """
+    The bare known-destination questionnaire for one trip shape: nothing
+    answered beyond destination, days, schedule style and group size.
+    """
+    return TripContext(
+        trip_mode="known",
+        has_discovery_intent=False,
+        knows_trip_length=True,
+        days=days,
+        people=people,
+        transport_mode="Not sure yet",
+        origin_location="Not specified",
+        international_travel=False,
+        has_dates=False,
+        has_time_constraints=False,
+        area_structure="Not specified",
+        special_group_needs=["None"],
+        accessibility_needs=False,
+        destination=destination,
+        schedule_style=schedule_style,
+    )
+
+
+# Answers a generic plan for the trip shape would get wrong. Requests that
+# give any of them are always generated for; soft preferences (interest
+# levels, cuisine, pace of mornings...) do not stop a warm entry from serving.
+WARM_BLOCKING_FIELDS = (
+    "date_range",
+    "time_constraints_detail",
+    "accessibility_details",
+    "budget_amount",
+    "must_do",
+    "must_avoid",
+    "excluded_places",
+    "additional_notes",
+    "weather_avoidance",
+)
+
+
+def warm_entry_for(ctx: TripContext) -> Optional[Dict[str, Any]]:
+    """
+    Pre-warmed itinerary for this request's trip shape (destination, days,
+    schedule style, people), if one exists and the request has no hard
+    constraints that a generic plan would miss.
+    """
+    if ctx.trip_mode != "known":
+        return None
+    if ctx.has_time_constraints or ctx.accessibility_needs:
+        return None
+    if any(need != "None" for need in ctx.special_group_needs):
+        return None
+    if any(getattr(ctx, field) for field in WARM_BLOCKING_FIELDS):
+        return None
+    return itinerary_store.warm_lookup(
+        itinerary_store.shape_key(ctx.destination, ctx.days, ctx.schedule_style, ctx.people),
+        prewarm_job.ttl_seconds,
+    )
+
+
+def estimate_warm_tokens(shape: Dict[str, Any]) -> int:
+    ctx = warm_shape_context(shape["destination"], shape["days"], shape["schedule_style"], shape["people"])
+    prompt_tokens = len(build_prompt(ctx) + get_itinerary_schema_prompt()) // 4
+    return prompt_tokens + token_budgeter.predict(ctx.days, ctx.schedule_style, ctx.trip_mode)
+
+
+def generate_warm_entry(shape: Dict[str, Any]):
+    """
+    Generates, stores and renders one trip shape for the pre-warm job; the
+    PDF is put in the render cache, where requests for it are served from.
+    Returns the id and the tokens actually spent so the job can track its
+    budget.
+    """
+    return run_background(build_warm_entry, PREWARM_CLIENT, shape)
+
+
+def build_warm_entry(
+    shape: Dict[str, Any],
+    deadline: Deadline,
+    client_identity: ClientIdentity,
+):
+    ctx = warm_shape_context(shape["destination"], shape["days"], shape["schedule_style"], shape["people"])
+    usage = CallUsage()
+    started = time.time()
+    try:
+        itinerary = request_itinerary(ctx, deadline, client_identity, usage)
+    finally:
+        ledger.record(
+            "prewarm", client_identity.client_id, usage, started,
+            "generated" if usage.attempts else "error",
+            ctx.trip_mode, ctx.days, ctx.schedule_style,
+        )
+
+    answers = ctx.model_dump(exclude_none=True)
+    stored_id = itinerary_store.save(itinerary, answers, ctx.destination)
+    if SIMILARITY_ENABLED:
+        similarity_index.add(stored_id, answers)
+
+    render_cached(stored_id, itinerary, "pdf", answers)
+
+    return stored_id, usage.total_tokens
+
+
+prewarm_job = PrewarmJob(
+    itinerary_store,
+    generate=generate_warm_entry,
+    estimate=estimate_warm_tokens,
+    token_budget=int(os.getenv("PREWARM_TOKEN_BUDGET", "200000")),
+    top_shapes=int(os.getenv("PREWARM_TOP_SHAPES", "50")),
+    history_days=int(os.getenv("PREWARM_HISTORY_DAYS", "30")),
+    off_peak_hours=os.getenv("PREWARM_HOURS", "2-5"),
+    ttl_hours=float(os.getenv("PREWARM_TTL_HOURS", "72")),
+)
+
+
+def prefetch_itinerary(ctx: TripContext, client_identity: ClientIdentity) -> Dict[str, Any]:
+    """
+    Generates the top shortlist candidate in the background, at batch
+    priority and only on an idle slot.
+    """
+    return run_background(build_prefetch, client_identity.with_priority(BATCH), ctx)
+
+
+def build_prefetch(
+    ctx: TripContext,
+    deadline: Deadline,
+    client_identity: ClientIdentity,
+) -> Dict[str, Any]:
+    usage = CallUsage()
+    started = time.time()
+    source = "error"
+    try:
+        itinerary = request_itinerary(ctx, deadline, client_identity, usage)
+        source = "generated"
+    finally:
+        ledger.record(
+            "prefetch", client_identity.client_id, usage, started, source,
+            ctx.trip_mode, ctx.days, ctx.schedule_style,
+        )
+
+    # Stored and indexed right away: if the pick gave up waiting and
+    # generated on its own, a retry of it can still reuse this result.
+    request_answers = ctx.model_dump(exclude_none=True, exclude={"variants"})
+    stored_id = itinerary_store.save(itinerary, request_answers, planned_destination(ctx))
+    if SIMILARITY_ENABLED:
+        similarity_index.add(stored_id, request_answers)
+    return itinerary
+
+
+def build_shortlist_response(
+    ctx: TripContext,
+    deadline: Deadline,
+    client_identity: ClientIdentity,
+) -> ShortlistResponse:
+    usage = CallUsage()
+    started = time.time()
+    try:
+        candidates = request_shortlist(ctx, deadline, client_identity, usage)
+    finally:
+        ledger.record(
+            "shortlist", client_identity.client_id, usage, started,
+            "generated" if usage.attempts else "error",
+            ctx.trip_mode, ctx.days, ctx.schedule_style,
+        )
+    shortlist_id = uuid.uuid4().hex
+
+    if ctx.prefetch_top_candidate:
+        top_ctx = ctx.model_copy(
+            update={"selected_destination": candidates[0]["destination"]}
+        )
+        prefetcher.submit(
+            shortlist_id,
+            candidates[0]["destination"],
+            prefetch_itinerary,
+            top_ctx,
+            client_identity,
+        )
+
+    return ShortlistResponse(shortlist_id=shortlist_id, candidates=candidates)
+
+
+def build_itinerary_response(
+    ctx: TripContext,
+    deadline: Deadline,
+    client_identity: ClientIdentity,
+    latency_target: Optional[float] = None,
+) -> TripResponse:
+    usage = CallUsage()
+    started = time.time()
+    source = "error"
+    try:
+        response = generate_trip_response(ctx, deadline, client_identity, usage, latency_target)
+        source = response.source
+        return response
+    finally:
+        ledger.record(
+            "itinerary", client_identity.client_id, usage, started, source,
+            ctx.trip_mode, ctx.days, ctx.schedule_style,
+        )
+
+
+def generate_trip_response(
+    ctx: TripContext,
+    deadline: Deadline,
+    client_identity: ClientIdentity,
+    usage: CallUsage,
+    latency_target: Optional[float] = None,
+) -> TripResponse:
+    # Asking for alternatives means asking for fresh ones: reuse paths
+    # (warm cache, prefetched pick, similar requests) only serve one.
+    variants = ctx.variants or 1
+    reuse = variants == 1
+
+    if ctx.trip_mode == "known":
+        itinerary_store.record_request_shape(ctx.destination, ctx.days, ctx.schedule_style, ctx.people)
+        warm = warm_entry_for(ctx) if reuse else None
+        if warm is not None:
+            return TripResponse(
+                itinerary=warm["itinerary"],
+                itinerary_id=warm["id"],
+                source="warm_cache",
+                notice=(
+                    "Pre-planned itinerary for this destination, trip length, pace and group size; "
+                    "interest and taste preferences were not applied."
+                ),
+            )
+
+    validated_itinerary = None
+    alternatives: List[Dict[str, Any]] = []
+    if ctx.shortlist_id and reuse:
+        validated_itinerary = prefetcher.take(
+            ctx.shortlist_id,
+            ctx.selected_destination,
+            timeout=min(PREFETCH_MAX_WAIT_SECONDS, deadline.remaining() * PREFETCH_WAIT_SHARE),
+        )
+
+    source, notice = "generated", None
+    request_answers = ctx.model_dump(exclude_none=True, exclude={"variants"})
+
+    if validated_itinerary is None and SIMILARITY_ENABLED and reuse:
+        match = similarity_index.lookup(request_answers)
+        stored = itinerary_store.get(match[0]) if match is not None else None
+        if stored is not None:
+            validated_itinerary = stored["itinerary"]
+            stored_id = match[0]
+            source = "similar_request"
+
+    if validated_itinerary is None:
+        from openai import APIError
+
+        try:
+            validated_itinerary, *alternatives = request_itineraries(
+                ctx, deadline, client_identity, usage, latency_target, variants
+            )
+        except (CircuitOpenError, APIError) as e:
+            fallback = degraded_itinerary(ctx)
+            if fallback is None:
+                if isinstance(e, CircuitOpenError):
+                    raise
+                raise CircuitOpenError(breaker.retry_after()) from e
+            validated_itinerary, notice = fallback
+            source = "degraded_cache"
+
+    if source != "similar_request":
+        # Degraded results are stored only so their id can be re-fetched:
+        # without a destination, closest() never serves a trimmed copy of
+        # a copy as if it were a real plan.
+        stored_id = itinerary_store.save(
+            validated_itinerary,
+            request_answers,
+            None if source == "degraded_cache" else planned_destination(ctx),
+        )
+        if source == "generated" and SIMILARITY_ENABLED:
+            similarity_index.add(stored_id, request_answers)
+
+    # Alternatives are stored like any other itinerary; their PDFs are only
+    # rendered if someone fetches them.
+    variant_responses = []
+    for alternative in alternatives:
+        alternative_id = itinerary_store.save(alternative, request_answers, planned_destination(ctx))
+        if alternative_id != stored_id and all(v.itinerary_id != alternative_id for v in variant_responses):
+            variant_responses.append(ItineraryVariant(
+                itinerary=alternative,
+                itinerary_id=alternative_id,
+                pdf_url=f"/itineraries/{alternative_id}?format=pdf",
+            ))
 
     # -----------------------------------------------------
     # PDF generation layer
     # -----------------------------------------------------
-    os.makedirs("generated_pdfs", exist_ok=True)
+    if EAGER_PDF:
+        from .pdf_generator import generate_itinerary_pdf
+
+        deadline.check()
+        os.makedirs("generated_pdfs", exist_ok=True)
 
-    timestamp = datetime.now().strftime("%m_%d_%Y_%H%M%S")
-    pdf_path = f"generated_pdfs/itinerary_{timestamp}.pdf"
+        timestamp = datetime.now().strftime("%m_%d_%Y_%H%M%S")
+        pdf_path = f"generated_pdfs/itinerary_{timestamp}.pdf"
 
-    generate_itinerary_pdf(
-        validated_itinerary,
-        pdf_path
+        generate_itinerary_pdf(
+            validated_itinerary,
+            pdf_path,
+            should_stop=deadline.expired,
+        )
+
+    return TripResponse(
+        itinerary=validated_itinerary,
+        itinerary_id=stored_id,
+        source=source,
+        notice=notice,
+        alternatives=variant_responses if variants > 1 else None,
     )
 
-    return TripResponse(itinerary=validated_itinerary)
\ No newline at end of file
+def render_key(
+    itinerary_id: str,
+    fmt: str,
+    context: Optional[Dict[str, Any]] = None,
+    start_date: Optional[date] = None,
+) -> tuple:
+    """
+    Render cache key of one representation; compressed copies add the
+    encoding. Only the calendar depends on anything beyond the itinerary
+    itself, so only its key carries the daily times and start date.
+    """
+    key = (itinerary_id, fmt)
+    if fmt == "ics":
+        context = context or {}
+        key += (
+            context.get("start_time_preference"),
+            context.get("start_time_other_text"),
+            context.get("end_time_preference"),
+            context.get("end_time_other_text"),
+            start_date,
+        )
+    return key
+
+
+def render_cached(
+    itinerary_id: str,
+    itinerary: Dict[str, Any],
+    fmt: str,
+    context: Dict[str, Any],
+    start_date: Optional[date] = None,
+) -> bytes:
+    """
+    Renders one format of a stored itinerary, reusing earlier renders.
+    """
+    key = render_key(itinerary_id, fmt, context, start_date)
+    body = render_cache.get(key)
+    if body is None:
+        body = render(itinerary, fmt, context, start_date, uid_prefix=itinerary_id[:16])
+        render_cache.put(key, body)
+    return body
+
+
+def stored_representation(
+    itinerary_id: str,
+    fmt: str,
+    start_date: Optional[date],
+    encoding: Optional[str],
+):
+    """
+    Body of one representation of a stored itinerary, compressed with
+    `encoding` when worthwhile, from the render cache when possible.
+    Returns (body, encoding actually used), or None for an unknown id.
+    """
+    # Same keys as render_cached, so bodies rendered (or pre-warmed) for a
+    # POST are served here too. The calendar key needs the stored context.
+    stored = None
+    if fmt == "ics":
+        stored = itinerary_store.get(itinerary_id)
+        if stored is None:
+            return None
+        key = render_key(itinerary_id, fmt, stored["context"], start_date)
+    else:
+        key = render_key(itinerary_id, fmt)
+    if encoding:
+        body = render_cache.get(key + (encoding,))
+        if body is not None:
+            return body, encoding
+
+    body = render_cache.get(key)
+    if body is None:
+        if stored is None:
+            stored = itinerary_store.get(itinerary_id)
+        if stored is None:
+            return None
+        if fmt == "json":
+            body = TripResponse(
+                itinerary=stored["itinerary"], itinerary_id=itinerary_id, source="stored"
+            ).model_dump_json().encode("utf-8")
+        else:
+            body = render(stored["itinerary"], fmt, stored["context"], start_date, uid_prefix=itinerary_id[:16])
+        render_cache.put(key, body)
+
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        body = compress(body, encoding)
+        render_cache.put(key + (encoding,), body)
+        return body, encoding
+    return body, None
+
+
+def encoded_body(body: bytes, fmt: str, request: Request):
+    """
+    Compresses a text body as negotiated from Accept-Encoding.
+    Returns (body, encoding or None).
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if fmt in COMPRESSIBLE_FORMATS and encoding and len(body) >= MIN_COMPRESS_BYTES:
+        return compress(body, encoding), encoding
+    return body, None
+
+
+def rendered_response(
+    itinerary_id: str,
+    fmt: str,
+    body: bytes,
+    headers: Dict[str, str],
+    encoding: Optional[str] = None,
+    status_code: int = 200,
+) -> Response:
+    headers = dict(headers)
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if fmt in ("pdf", "ics"):
+        headers["Content-Disposition"] = (
+            f'attachment; filename="itinerary_{itinerary_id[:12]}.{FILE_EXTENSIONS[fmt]}"'
+        )
+    return Response(content=body, media_type=MEDIA_TYPES[fmt], headers=headers, status_code=status_code)
+
+def booklet_entries(itinerary_ids: List[str], entry_titles: Optional[List[str]]):
+    """
+    Yields (title, itinerary) pairs straight from the store, one at a time.
+    """
+    for index, key in enumerate(itinerary_ids):
+        stored = itinerary_store.get(key)
+        itinerary = stored["itinerary"]
+        if entry_titles:
+            title = entry_titles[index]
+        else:
+            context = stored["context"]
+            place = context.get("destination") or context.get("selected_destination") or "Trip"
+            title = f"{place} - {len(itinerary.get('days', []))} days"
+        yield title, itinerary
+
+
+def build_booklet(
+    booklet: BookletRequest,
+    deadline: Deadline,
+    client_identity: ClientIdentity,
+) -> str:
+    """
+    Renders the booklet to a temporary file and returns its path; the
+    caller deletes it once sent. Stops at the request deadline.
+    """
+    from .booklet import generate_booklet_pdf
+
+    fd, pdf_path = tempfile.mkstemp(prefix="booklet_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            generate_booklet_pdf(
+                booklet_entries(booklet.itinerary_ids, booklet.entry_titles),
+                f,
+                booklet_title=booklet.title,
+                should_stop=deadline.expired,
+            )
+    except BaseException:
+        os.remove(pdf_path)
+        raise
+    return pdf_path
+
+# ---------- Endpoints ----------
+
+@app.post("/discover-shortlist", response_model=ShortlistResponse)
+async def discover_shortlist(ctx: TripContext, request: Request):
+    """
+    Stage one of discover mode: rank a few candidate destinations.
+    The full itinerary is generated later for the chosen candidate only,
+    and optionally prefetched for the top-ranked one.
+    """
+    if ctx.trip_mode != "discover":
+        raise HTTPException(400, "discover-shortlist requires trip_mode='discover'")
+
+    validate_trip_context(ctx)
+    ctx, _ = preflight_trip_dates(ctx)
+
+    return await run_admitted(request, build_shortlist_response, ctx)
+
+
+@app.post("/generate-itinerary", response_model=TripResponse)
+async def generate_itinerary(ctx: TripContext, request: Request):
+    """
+    Returns JSON by default. Accept: text/html, text/markdown,
+    text/calendar or application/pdf returns that rendering instead.
+
+    With "variants": n, up to n itineraries come from one upstream call;
+    the first is the response itinerary and the other valid ones are
+    listed in "alternatives" (and as Link rel="alternate" headers).
+    """
+    fmt = negotiate_format(request.headers.get("accept"))
+    if fmt is None:
+        raise HTTPException(406, f"Supported types: {', '.join(MEDIA_TYPES.values())}")
+
+    validate_trip_context(ctx)
+    ctx, schedule = preflight_trip_dates(ctx)
+
+    latency_target = request_latency_target(request)
+    trip_response = await run_admitted(
+        request, partial(build_itinerary_response, latency_target=latency_target), ctx
+    )
+    trip_response.adjustments = schedule.notes or None
+    headers = {
+        "X-Itinerary-Id": trip_response.itinerary_id,
+        "X-Itinerary-Source": trip_response.source,
+        # Where to re-fetch (and revalidate) this itinerary later.
+        "Content-Location": f"/itineraries/{trip_response.itinerary_id}",
+    }
+    if trip_response.alternatives:
+        headers["Link"] = ", ".join(
+            f'</itineraries/{variant.itinerary_id}>; rel="alternate"'
+            for variant in trip_response.alternatives
+        )
+
+    if fmt == "json":
+        body = trip_response.model_dump_json().encode("utf-8")
+    else:
+        body = await anyio.to_thread.run_sync(
+            render_cached,
+            trip_response.itinerary_id,
+            trip_response.itinerary,
+            fmt,
+            ctx.model_dump(exclude_none=True),
+            schedule.start_date,
+        )
+    body, encoding = encoded_body(body, fmt, request)
+    return rendered_response(trip_response.itinerary_id, fmt, body, headers, encoding)
+
+
+@app.post("/itineraries/booklet")
+async def itinerary_booklet(booklet: BookletRequest, request: Request):
+    """
+    One PDF with a table of contents for many stored itineraries,
+    e.g. a tour operator's whole client list.
+    """
+    if not booklet.itinerary_ids:
+        raise HTTPException(400, "itinerary_ids must not be empty")
+    if len(booklet.itinerary_ids) > BOOKLET_MAX_ITINERARIES:
+        raise HTTPException(400, f"A booklet can hold at most {BOOKLET_MAX_ITINERARIES} itineraries")
+    if booklet.entry_titles is not None and len(booklet.entry_titles) != len(booklet.itinerary_ids):
+        raise HTTPException(400, "entry_titles must have one title per itinerary id")
+
+    missing = itinerary_store.missing(booklet.itinerary_ids)
+    if missing:
+        raise HTTPException(404, f"Itineraries not found: {', '.join(missing[:5])}")
+
+    pdf_path = await run_admitted(request, build_booklet, booklet)
+    filename = f"booklet_{datetime.now().strftime('%m_%d_%Y_%H%M%S')}.pdf"
+    return FileResponse(
+        pdf_path,
+        media_type="application/pdf",
+        filename=filename,
+        background=BackgroundTask(os.remove, pdf_path),
+    )
+
+
+@app.get("/itineraries/{itinerary_id}")
+async def get_itinerary(
+    itinerary_id: str,
+    request: Request,
+    format: Optional[str] = None,
+    start_date: Optional[date] = None,
+):
+    """
+    A stored itinerary in the format chosen by ?format= or the Accept
+    header (json, html, markdown, ics, pdf), rendered on first request.
+    start_date (YYYY-MM-DD) anchors the calendar; by default it starts on
+    the trip's first day, or tomorrow when the request had no dates.
+
+    Responses carry a strong ETag; a matching If-None-Match gets 304
+    without loading or rendering anything. Text formats are gzip/brotli
+    compressed as negotiated, and PDFs honour single byte ranges.
+    """
+    fmt = format or negotiate_format(request.headers.get("accept"))
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(406, f"Supported formats: {', '.join(MEDIA_TYPES)}")
+
+    cache_control = f"private, max-age={ITINERARY_CACHE_MAX_AGE}, immutable"
+    if fmt == "ics" and start_date is None:
+        stored = await anyio.to_thread.run_sync(itinerary_store.get, itinerary_id)
+        if stored is None:
+            raise HTTPException(404, "Itinerary not found")
+        start_date = stored_start_date(stored["context"])
+        if start_date is None:
+            # The default anchor moves daily, so clients must revalidate.
+            start_date = date.today() + timedelta(days=1)
+            cache_control = "private, no-cache"
+
+    etag = entity_tag(itinerary_id, fmt, start_date)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept, Accept-Encoding"}
+    if fmt == "pdf":
+        headers["Accept-Ranges"] = "bytes"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = None
+    if fmt in COMPRESSIBLE_FORMATS:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+
+    result = await anyio.to_thread.run_sync(
+        stored_representation, itinerary_id, fmt, start_date, encoding
+    )
+    if result is None:
+        raise HTTPException(404, "Itinerary not found")
+    body, encoding = result
+    if encoding:
+        headers["ETag"] = entity_tag(itinerary_id, fmt, start_date, encoding=encoding)
+
+    if fmt == "pdf":
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            try:
+                byte_range = parse_range(request.headers.get("range"), len(body))
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(body)}"})
+            if byte_range is not None:
+                start, end = byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+                return rendered_response(itinerary_id, fmt, body[start:end + 1], headers, status_code=206)
+
+    return rendered_response(itinerary_id, fmt, body, headers, encoding)
+
+
+@app.get("/metrics/token-budget")
+def token_budget_metrics():
+    """
+    Truncation rate and over-allocation of the max_tokens budgets.
+    """
+    return token_budgeter.stats()
+
+
+@app.get("/metrics/stream-validation")
+def stream_validation_metrics():
+    """
+    Early-aborted generations and the estimated tokens and time they saved.
+    """
+    return stream_stats.stats()
+
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    """
+    Queue depth, estimated wait and shed/timeout counters.
+    """
+    return admission.stats()
+
+
+@app.get("/metrics/circuit-breaker")
+def circuit_breaker_metrics():
+    """
+    Breaker state and call/failure/rejection counters.
+    """
+    return breaker.stats()
+
+
+@app.get("/metrics/similarity")
+def similarity_metrics():
+    """
+    Near-duplicate lookups and hit rate.
+    """
+    return similarity_index.stats()
+
+
+@app.get("/metrics/clients")
+def client_metrics():
+    """
+    Per-client upstream queue depth, wait times and token use.
+    """
+    return scheduler.stats()
+
+
+@app.get("/metrics/prewarm")
+def prewarm_metrics():
+    """
+    Report of the last pre-warm run.
+    """
+    return prewarm_job.last_report
+
+
+@app.get("/ledger/summary")
+def ledger_summary(group_by: str = "client", since_days: Optional[float] = None):
+    """
+    Token spend, latency, retries and cache-hit rate grouped by client,
+    trip_mode, days, weekday, kind, source or model.
+    """
+    since = time.time() - since_days * 86400 if since_days else 0.0
+    try:
+        return ledger.summary(group_by, since)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@app.get("/ledger/budgets")
+def ledger_budgets():
+    """
+    Today's token use against each configured client's daily budget.
+    """
+    return {
+        identity.client_id: {
+            "daily_token_budget": identity.daily_token_budget,
+            "tokens_today": ledger.tokens_today(identity.client_id),
+        }
+        for identity in client_registry.clients()
+    }
+
+
+@app.get("/metrics/render-cache")
+def render_cache_metrics():
+    """
+    Size and hit rate of the per-itinerary render cache.
+    """
+    return render_cache.stats()
+
+
+@app.get("/ready")
+def readiness():
+    """
+    Readiness probe: 200 once the background warm-up has finished,
+    503 while it is still loading the model client and PDF stack.
+    Requests are served either way; they just pay the load themselves.
+    """
+    status = warmup.status()
+    if WARMUP_ENABLED and not status["ready"]:
+        return JSONResponse(status, status_code=503)
+    return status
+
+
+@app.get("/metrics/routing")
+def routing_metrics():
+    """
+    Model routing: share of requests per route, models that served them,
+    escalations, and latency per route.
+    """
+    return router.stats()
@@ -0,0 +1,324 @@
+"""
+Model routing for itinerary generation.
+
+Each request is scored for complexity (trip length, discover vs known,
+international / multi-country, constraints) and sent to the cheapest
+route that handles that score. An optional client latency target can move
+it to a faster route. When a route's output fails or is invalid, the
+retry escalates to a stronger route; the last retry always goes to the
+strongest one.
+
+Routes come from a local JSON file (MODEL_ROUTES_PATH), ordered weakest
+to strongest:
+
+    {
+      "routes": [
+        {"name": "light", "model": "gpt-4o-mini", "temperature": 0.7,
+         "max_complexity": 6, "seconds_per_1k_tokens": 12},
+        {"name": "strong", "model": "gpt-4o", "temperature": 0.4,
+         "base_url": "http://localhost:8080/v1", "api_key_env": "STANDIN_KEY"}
+      ]
+    }
+
+`base_url` / `api_key_env` point a route at any OpenAI-compatible server,
+e.g. a local stand-in for testing. A route without max_complexity takes
+everything above the previous one.
+
+The built-in routes all use the baseline model (gpt-4o-mini) and only
+differ in temperature; a stronger, costlier model is opt-in through the
+routes file (see model_routes.example.json).
+"""
+
+import json
+import math
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# How strongly a new latency observation moves a route's speed estimate.
+LATENCY_EWMA_ALPHA = 0.2
+
+# Latencies kept per route for percentiles.
+LATENCY_WINDOW = 200
+
+DEFAULT_ROUTES = [
+    {"name": "light", "model": "gpt-4o-mini", "temperature": 0.7, "max_complexity": 6, "seconds_per_1k_tokens": 12},
+    {"name": "standard", "model": "gpt-4o-mini", "temperature": 0.5, "max_complexity": 14, "seconds_per_1k_tokens": 12},
+    {"name": "strong", "model": "gpt-4o-mini", "temperature": 0.4, "seconds_per_1k_tokens": 12},
+]
+
+
+class Route:
+    __slots__ = (
+        "name", "model", "temperature", "max_complexity",
+        "seconds_per_1k_tokens", "base_url", "api_key_env",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        temperature: float = 0.7,
+        max_complexity: Optional[float] = None,
+        seconds_per_1k_tokens: float = 12.0,
+        base_url: Optional[str] = None,
+        api_key_env: Optional[str] = None,
+    ):
+        self.name = name
+        self.model = model
+        self.temperature = temperature
+        self.max_complexity = math.inf if max_complexity is None else max_complexity
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+
+
+def trip_complexity(answers: Dict[str, Any]) -> float:
+    """
+    Rough planning difficulty of a request, from its structured answers.
+    A 1-day known-destination trip scores about 1; a 14-day multi-country
+    discover trip scores over 20.
+    """
+    score = float(answers.get("days") or 7)
+    if answers.get("trip_mode") == "discover":
+        score += 3
+    if answers.get("international_travel"):
+        score += 2
+    score += max(0, len(answers.get("preferred_countries") or []) - 1)
+    if answers.get("has_time_constraints"):
+        score += 1
+    if answers.get("accessibility_needs"):
+        score += 1
+    if any(need != "None" for need in answers.get("special_group_needs") or []):
+        score += 1
+    if answers.get("schedule_style") == "Packed":
+        score += 1
+    return score
+
+
+def attempt_routes(routes: List[Route], attempts: int) -> List[Route]:
+    """
+    The route for each of `attempts` tries, given the planned routes
+    (chosen one first). Tries step up one route at a time, but the last
+    one always uses the strongest route, so even a single retry gets there.
+    """
+    if attempts <= 1:
+        return routes[:1]
+    middle = [routes[min(i, len(routes) - 1)] for i in range(1, attempts - 1)]
+    return [routes[0], *middle, routes[-1]]
+
+
+def load_routes(path: Optional[str]) -> List[Route]:
+    """
+    Routes from the JSON file at `path`, or the built-in defaults when
+    there is no such file.
+    """
+    entries = DEFAULT_ROUTES
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)["routes"]
+    if not entries:
+        raise ValueError("Model routing config must define at least one route")
+
+    routes = [Route(**entry) for entry in entries]
+
+    if len({route.name for route in routes}) != len(routes):
+        raise ValueError("Model route names must be unique")
+    if any(a.max_complexity > b.max_complexity for a, b in zip(routes, routes[1:])):
+        raise ValueError("Model routes must be ordered by max_complexity")
+    return routes
+
+
+class ModelRouter:
+    """
+    Picks routes and records how each one performs.
+    """
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+        self._lock = threading.Lock()
+        self._seconds_per_1k = {r.name: r.seconds_per_1k_tokens for r in routes}
+        self._stats = {
+            r.name: {
+                "routed": 0,
+                "escalated_to": 0,
+                "attempts": 0,
+                "succeeded": 0,
+                "failed": 0,
+                "latencies": deque(maxlen=LATENCY_WINDOW),
+            }
+            for r in routes
+        }
+
+    def estimated_seconds(self, route: Route, expected_tokens: int) -> float:
+        with self._lock:
+            return self._seconds_per_1k[route.name] * expected_tokens / 1000
+
+    def plan(
+        self,
+        answers: Dict[str, Any],
+        expected_tokens: int,
+        latency_target: Optional[float] = None,
+    ) -> List[Route]:
+        """
+        Routes to try, in order: the chosen one first, then every
+        stronger route to escalate to if its output fails.
+
+        The chosen route is the weakest one rated for the request's
+        complexity. With a latency target it is the strongest route up to
+        that one whose estimated time fits, or the fastest route if none do.
+        """
+        complexity = trip_complexity(answers)
+        index = next(
+            (i for i, r in enumerate(self.routes) if complexity <= r.max_complexity),
+            len(self.routes) - 1,
+        )
+
+        if latency_target is not None:
+            fitting = [
+                i for i in range(index + 1)
+                if self.estimated_seconds(self.routes[i], expected_tokens) <= latency_target
+            ]
+            if fitting:
+                index = fitting[-1]
+            else:
+                index = min(
+                    range(index + 1),
+                    key=lambda i: self.estimated_seconds(self.routes[i], expected_tokens),
+                )
+
+        with self._lock:
+            self._stats[self.routes[index].name]["routed"] += 1
+        return self.routes[index:]
+
+    def record(
+        self,
+        route: Route,
+        seconds: float,
+        ok: bool,
+        completion_tokens: Optional[int] = None,
+        escalated: bool = False,
+    ) -> None:
+        """
+        One attempt on `route`. Successful attempts with real token counts
+        update the route's speed estimate used for latency targets.
+        """
+        with self._lock:
+            stats = self._stats[route.name]
+            stats["attempts"] += 1
+            stats["succeeded" if ok else "failed"] += 1
+            if escalated:
+                stats["escalated_to"] += 1
+            stats["latencies"].append(seconds)
+            if ok and completion_tokens:
+                observed = seconds * 1000 / completion_tokens
+                self._seconds_per_1k[route.name] += LATENCY_EWMA_ALPHA * (
+                    observed - self._seconds_per_1k[route.name]
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(s["routed"] for s in self._stats.values())
+            routes = {}
+            for route in self.routes:
+                s = self._stats[route.name]
+                latencies = sorted(s["latencies"])
+                routes[route.name] = {
+                    "model": route.model,
+                    "temperature": route.temperature,
+                    "max_complexity": None if math.isinf(route.max_complexity) else route.max_complexity,
+                    "base_url": route.base_url,
+                    "routed": s["routed"],
+                    "routed_share": round(s["routed"] / total, 4) if total else 0.0,
+                    "escalated_to": s["escalated_to"],
+                    "attempts": s["attempts"],
+                    "succeeded": s["succeeded"],
+                    "failed": s["failed"],
+                    "latency_p50_seconds": _percentile(latencies, 0.5),
+                    "latency_p95_seconds": _percentile(latencies, 0.95),
+                    "seconds_per_1k_tokens": round(self._seconds_per_1k[route.name], 3),
+                }
+            models: Dict[str, int] = {}
+            for route in self.routes:
+                models[route.model] = models.get(route.model, 0) + self._stats[route.name]["succeeded"]
+            return {"requests_routed": total, "served_by_model": models, "routes": routes}
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))], 3)
+
+
+# Local check against a stand-in OpenAI-compatible server; not used by FastAPI.
+# python -m backend.model_router
+if __name__ == "__main__":
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    assert all(entry["model"] == "gpt-4o-mini" for entry in DEFAULT_ROUTES)
+
+    class StandIn(BaseHTTPRequestHandler):
+        """Streams prose for model "prose" and a one-day itinerary otherwise."""
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+            model = body["model"]
+            if model == "prose":
+                text = "Sure! Day 1: start with a walk around the old town."
+            else:
+                text = json.dumps({
+                    "days": [{"day": 1, "sections": {"morning": ["Walk"], "afternoon": ["Lunch"], "evening": ["Dinner"]}}],
+                    "summary": f"Planned by {model}",
+                })
+            chunks = [{"index": 0, "delta": {"content": text[i:i + 40]}, "finish_reason": None}
+                      for i in range(0, len(text), 40)]
+            chunks.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.end_headers()
+            for choice in chunks:
+                event = {"id": "standin", "object": "chat.completion.chunk", "created": 0,
+                         "model": model, "choices": [choice]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            usage = {"prompt_tokens": 100, "completion_tokens": len(text) // 4,
+                     "total_tokens": 100 + len(text) // 4}
+            event = {"id": "standin", "object": "chat.completion.chunk", "created": 0,
+                     "model": model, "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode())
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    workdir = tempfile.mkdtemp()
+    routes_path = os.path.join(workdir, "routes.json")
+    with open(routes_path, "w", encoding="utf-8") as f:
+        json.dump({"routes": [
+            {"name": name, "model": model, "max_complexity": limit,
+             "base_url": base_url, "api_key_env": "STANDIN_KEY"}
+            for name, model, limit in (("light", "prose", 6), ("standard", "standard", 14), ("strong", "strong", None))
+        ]}, f)
+    os.environ.update({
+        "STANDIN_KEY": "standin",
+        "MODEL_ROUTES_PATH": routes_path,
+        "STREAM_MAX_RETRIES": "1",
+        "ITINERARY_DB_PATH": os.path.join(workdir, "itineraries.db"),
+        "TOKEN_HISTORY_PATH": os.path.join(workdir, "token_usage.jsonl"),
+        "LEDGER_PATH": os.path.join(workdir, "ledger.jsonl"),
+    })
+
+    from . import main
+
+    ctx = main.warm_shape_context("Lisbon", 1, None, 2)
+    itinerary = main.request_itinerary(ctx)
+    stats = main.router.stats()
+    print(f"1-day trip: routed to light (prose), served by {itinerary['summary'].split()[-1]!r}")
+    print("per route:", {name: (s["routed"], s["attempts"], s["succeeded"]) for name, s in stats["routes"].items()},
+          "(routed, attempts, succeeded)")
+    assert itinerary["summary"] == "Planned by strong", "a single retry must reach the strongest route"
+    server.shutdown()
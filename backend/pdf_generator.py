@@ -3,15 +3,119 @@ PDF generator for travel itineraries.
 Uses reportlab for simple, reliable PDF generation.
 """
 
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, List, Callable, Iterator, Optional
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.colors import HexColor
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from reportlab.platypus import Flowable, SimpleDocTemplate, Paragraph, Spacer, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 
+from .admission import RenderCancelled
 
-def generate_itinerary_pdf(itinerary: dict, output_path: str) -> None:
+
+@lru_cache(maxsize=1)
+def itinerary_styles() -> Dict[str, ParagraphStyle]:
+    """
+    Paragraph styles shared by every itinerary render. Built once per
+    process; the single-itinerary PDF and the booklet both use them.
+    """
+    styles = getSampleStyleSheet()
+
+    return {
+        "title": ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=HexColor('#1a5490'),
+            spaceAfter=30,
+            alignment=TA_CENTER,
+        ),
+        "day_heading": ParagraphStyle(
+            'DayHeading',
+            parent=styles['Heading2'],
+            fontSize=16,
+            textColor=HexColor('#2a5490'),
+            spaceAfter=12,
+            spaceBefore=20,
+        ),
+        "section_heading": ParagraphStyle(
+            'SectionHeading',
+            parent=styles['Heading3'],
+            fontSize=13,
+            textColor=HexColor('#4a5490'),
+            spaceAfter=8,
+            spaceBefore=12,
+            leftIndent=20,
+        ),
+        "activity": ParagraphStyle(
+            'Activity',
+            parent=styles['Normal'],
+            fontSize=11,
+            leftIndent=40,
+            spaceAfter=6,
+            bulletIndent=30,
+        ),
+        "summary": ParagraphStyle(
+            'Summary',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=12,
+            spaceBefore=20,
+            leftIndent=20,
+            rightIndent=20,
+        ),
+    }
+
+
+def itinerary_story(
+    itinerary: dict,
+    styles: Dict[str, ParagraphStyle],
+    title: str = "Travel Itinerary",
+) -> Iterator[Flowable]:
+    """
+    Yields the flowables for one itinerary, one at a time, so callers
+    can lay out long documents without holding every Paragraph.
+    """
+    # Title
+    yield Paragraph(title, styles["title"])
+    yield Spacer(1, 0.3 * inch)
+
+    # Days
+    days = itinerary.get("days", [])
+
+    for day_data in days:
+        day_num = day_data.get("day", 0)
+        sections = day_data.get("sections", {})
+
+        # Day heading
+        yield Paragraph(f"Day {day_num}", styles["day_heading"])
+
+        for key, label in (("morning", "Morning"), ("afternoon", "Afternoon"), ("evening", "Evening")):
+            activities = sections.get(key, [])
+            if activities:
+                yield Paragraph(label, styles["section_heading"])
+                for activity in activities:
+                    bullet_text = f"• {activity}"
+                    yield Paragraph(bullet_text, styles["activity"])
+
+        # Add space between days
+        yield Spacer(1, 0.3 * inch)
+
+    # Summary section
+    summary = itinerary.get("summary", "")
+    if summary:
+        yield Spacer(1, 0.2 * inch)
+        yield Paragraph("Summary", styles["day_heading"])
+        yield Paragraph(summary, styles["summary"])
+
+
+def generate_itinerary_pdf(
+    itinerary: dict,
+    output_path: str,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> None:
     """
     Generate a PDF from a validated itinerary JSON.
 
@@ -30,7 +134,10 @@ def generate_itinerary_pdf(itinerary: dict, output_path: str) -> None:
                 ],
                 "summary": "string"
             }
-        output_path: Path where the PDF should be saved (e.g., "output.pdf")
+        output_path: Path where the PDF should be saved (e.g., "output.pdf"),
+            or a binary file object (e.g., io.BytesIO) to render into memory
+        should_stop: Optional callable checked before and after every page;
+            returning True aborts the render with RenderCancelled.
 
     Returns:
         None (writes PDF to output_path)
@@ -44,108 +151,17 @@ def generate_itinerary_pdf(itinerary: dict, output_path: str) -> None:
         bottomMargin=18,
     )
 
-    story = []
-    styles = getSampleStyleSheet()
-
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor='#1a5490',
-        spaceAfter=30,
-        alignment=TA_CENTER,
-    )
-
-    day_heading_style = ParagraphStyle(
-        'DayHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor='#2a5490',
-        spaceAfter=12,
-        spaceBefore=20,
-    )
-
-    section_heading_style = ParagraphStyle(
-        'SectionHeading',
-        parent=styles['Heading3'],
-        fontSize=13,
-        textColor='#4a5490',
-        spaceAfter=8,
-        spaceBefore=12,
-        leftIndent=20,
-    )
-
-    activity_style = ParagraphStyle(
-        'Activity',
-        parent=styles['Normal'],
-        fontSize=11,
-        leftIndent=40,
-        spaceAfter=6,
-        bulletIndent=30,
-    )
-
-    summary_style = ParagraphStyle(
-        'Summary',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=12,
-        spaceBefore=20,
-        leftIndent=20,
-        rightIndent=20,
-    )
-
-    # Title
-    story.append(Paragraph("Travel Itinerary", title_style))
-    story.append(Spacer(1, 0.3 * inch))
-
-    # Days
-    days = itinerary.get("days", [])
-
-    for day_data in days:
-        day_num = day_data.get("day", 0)
-        sections = day_data.get("sections", {})
-
-        # Day heading
-        story.append(Paragraph(f"Day {day_num}", day_heading_style))
-
-        # Morning section
-        morning_activities = sections.get("morning", [])
-        if morning_activities:
-            story.append(Paragraph("Morning", section_heading_style))
-            for activity in morning_activities:
-                bullet_text = f"• {activity}"
-                story.append(Paragraph(bullet_text, activity_style))
-
-        # Afternoon section
-        afternoon_activities = sections.get("afternoon", [])
-        if afternoon_activities:
-            story.append(Paragraph("Afternoon", section_heading_style))
-            for activity in afternoon_activities:
-                bullet_text = f"• {activity}"
-                story.append(Paragraph(bullet_text, activity_style))
-
-        # Evening section
-        evening_activities = sections.get("evening", [])
-        if evening_activities:
-            story.append(Paragraph("Evening", section_heading_style))
-            for activity in evening_activities:
-                bullet_text = f"• {activity}"
-                story.append(Paragraph(bullet_text, activity_style))
-
-        # Add space between days
-        story.append(Spacer(1, 0.3 * inch))
-
-    # Summary section
-    summary = itinerary.get("summary", "")
-    if summary:
-        story.append(Spacer(1, 0.2 * inch))
-        story.append(Paragraph("Summary", day_heading_style))
-        story.append(Paragraph(summary, summary_style))
+    story = list(itinerary_story(itinerary, itinerary_styles()))
 
     # Build PDF
-    doc.build(story)
-    print(f"PDF successfully generated at: {output_path}")
+    def check_stop(canvas, doc):
+        if should_stop is not None and should_stop():
+            raise RenderCancelled("PDF rendering cancelled")
+
+    check_stop(None, doc)
+    doc.build(story, onFirstPage=check_stop, onLaterPages=check_stop)
+    if isinstance(output_path, str):
+        print(f"PDF successfully generated at: {output_path}")
 
 # Local test runner for PDF generation; not used by FastAPI
 if __name__ == "__main__":
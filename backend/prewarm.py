@@ -0,0 +1,138 @@
+"""
+Off-peak pre-warming of popular trip shapes.
+
+Reads the most frequent known-destination (destination, days,
+schedule_style, people) shapes from request history, generates validated
+itineraries for them within a token budget (their PDFs go straight into
+the render cache), and registers them as warm entries. Entries older than
+the TTL stop being served and are regenerated on the next run. A later request
+with the same shape and no hard constraints a generic plan would miss is
+answered straight from the warm entry.
+
+Run once by hand with:
+
+    python -m backend.prewarm
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def parse_hours(spec: str) -> Tuple[int, int]:
+    """
+    "2-5" -> (2, 5): the job may start from 02:00 up to (not incl.) 05:00.
+    Wrapping windows such as "22-4" are allowed.
+    """
+    start, end = (int(part) for part in spec.split("-", 1))
+    if not (0 <= start <= 23 and 0 <= end <= 24):
+        raise ValueError(f"Invalid off-peak window {spec!r}")
+    return start, end
+
+
+def in_window(hour: int, window: Tuple[int, int]) -> bool:
+    start, end = window
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class PrewarmJob:
+    """
+    `generate(shape)` returns (itinerary_id, tokens_spent) for a history
+    shape; `estimate(shape)` returns the tokens it is expected to cost.
+    """
+
+    def __init__(
+        self,
+        store,
+        generate: Callable[[Dict[str, Any]], Tuple[str, int]],
+        estimate: Callable[[Dict[str, Any]], int],
+        token_budget: int = 200000,
+        top_shapes: int = 50,
+        history_days: int = 30,
+        off_peak_hours: str = "2-5",
+        ttl_hours: float = 72,
+    ):
+        self.store = store
+        self.generate = generate
+        self.estimate = estimate
+        self.token_budget = token_budget
+        self.top_shapes = top_shapes
+        self.history_days = history_days
+        self.window = parse_hours(off_peak_hours)
+        self.ttl_seconds = ttl_hours * 3600
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_run_date = None
+        self.last_report: Dict[str, Any] = {}
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        Warms the most frequent shapes that are not warm yet or whose entry
+        is older than the TTL, stopping before the estimated spend would
+        exceed the token budget.
+        """
+        with self._lock:
+            started = time.monotonic()
+            shapes = self.store.top_request_shapes(
+                self.top_shapes, time.time() - self.history_days * 86400
+            )
+            report = {"candidates": len(shapes), "warmed": 0, "skipped_warm": 0,
+                      "failed": 0, "estimated_tokens": 0, "budget_exhausted": False}
+
+            for shape in shapes:
+                key = self.store.shape_key(
+                    shape["destination"], shape["days"], shape["schedule_style"], shape["people"]
+                )
+                if self.store.warm_lookup(key, self.ttl_seconds) is not None:
+                    report["skipped_warm"] += 1
+                    continue
+                if report["estimated_tokens"] + self.estimate(shape) > self.token_budget:
+                    report["budget_exhausted"] = True
+                    break
+                try:
+                    itinerary_id, tokens = self.generate(shape)
+                except Exception:
+                    report["failed"] += 1
+                    continue
+                report["estimated_tokens"] += tokens
+                self.store.save_warm(key, itinerary_id)
+                report["warmed"] += 1
+
+            report["seconds"] = round(time.monotonic() - started, 2)
+            report["finished_at"] = datetime.now().isoformat(timespec="seconds")
+            self.last_report = report
+            return report
+
+    def start(self, check_every_seconds: float = 600) -> None:
+        """
+        Background loop: runs at most once a day inside the off-peak window.
+        """
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(check_every_seconds):
+                now = datetime.now()
+                if in_window(now.hour, self.window) and self._last_run_date != now.date():
+                    self._last_run_date = now.date()
+                    try:
+                        self.run_once()
+                    except Exception as e:
+                        self.last_report = {"error": str(e)}
+
+        self._thread = threading.Thread(target=loop, name="prewarm", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    from .main import prewarm_job
+
+    print(prewarm_job.run_once())
@@ -0,0 +1,395 @@
+"""
+Lightweight renderers for validated itineraries.
+
+HTML, Markdown and iCalendar output is built directly from the
+days/sections/summary structure with string formatting, which is far
+cheaper than a reportlab PDF. Results are cached per itinerary and format,
+and the endpoint picks the format from the Accept header.
+"""
+
+import html
+import io
+import re
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+SECTIONS = ("morning", "afternoon", "evening")
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "html": "text/html; charset=utf-8",
+    "markdown": "text/markdown; charset=utf-8",
+    "ics": "text/calendar; charset=utf-8",
+    "pdf": "application/pdf",
+}
+
+_ACCEPT_ALIASES = {
+    "application/json": "json",
+    "text/html": "html",
+    "text/markdown": "markdown",
+    "text/x-markdown": "markdown",
+    "text/calendar": "ics",
+    "application/pdf": "pdf",
+}
+
+FILE_EXTENSIONS = {"json": "json", "html": "html", "markdown": "md", "ics": "ics", "pdf": "pdf"}
+
+# Default day window when the questionnaire left start/end time unanswered.
+DEFAULT_START_HOUR = 9
+DEFAULT_END_HOUR = 21
+AFTERNOON_START_HOUR = 12
+EVENING_START_HOUR = 17
+
+
+# ---------- Content negotiation ----------
+
+def negotiate_format(accept: Optional[str], default: str = "json") -> Optional[str]:
+    """
+    Picks the best supported format for an Accept header.
+    Returns None if the header only lists unsupported types.
+    """
+    if not accept:
+        return default
+
+    best, best_q = None, 0.0
+    for position, part in enumerate(accept.split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        media_type = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in ("*/*", "application/*", "text/*"):
+            fmt = default if media_type == "*/*" or MEDIA_TYPES[default].startswith(media_type[:-1]) else None
+        else:
+            fmt = _ACCEPT_ALIASES.get(media_type)
+        # Ties keep the earlier entry; wildcards rank below explicit types.
+        rank = q - (0.0001 if "*" in media_type else 0.0)
+        if fmt is not None and q > 0 and rank > best_q:
+            best, best_q = fmt, rank
+    return best
+
+
+# ---------- HTML / Markdown ----------
+
+def render_html(itinerary: Dict[str, Any], title: str = "Travel Itinerary") -> str:
+    parts = [
+        "<!DOCTYPE html>",
+        '<html lang="en"><head><meta charset="utf-8">',
+        f"<title>{html.escape(title)}</title>",
+        "</head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+    ]
+    for day in itinerary.get("days", []):
+        parts.append(f"<section><h2>Day {html.escape(str(day.get('day', '')))}</h2>")
+        sections = day.get("sections", {})
+        for name in SECTIONS:
+            activities = sections.get(name) or []
+            if not activities:
+                continue
+            parts.append(f"<h3>{name.capitalize()}</h3><ul>")
+            parts.extend(f"<li>{html.escape(str(a))}</li>" for a in activities)
+            parts.append("</ul>")
+        parts.append("</section>")
+    summary = itinerary.get("summary")
+    if summary:
+        parts.append(f"<h2>Summary</h2><p>{html.escape(str(summary))}</p>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+_MD_INLINE = re.compile(r"([\\`*_\[\]<>&|~])")
+_MD_BLOCK_MARKER = re.compile(r"^([#>+\-=]|\d+[.)])")
+
+
+def _md_escape(text: Any) -> str:
+    """
+    Model text as literal Markdown: characters that could start emphasis,
+    links, code or inline HTML are backslash-escaped, as is a leading
+    heading/list/quote marker, and newlines (which would end a list item)
+    become spaces.
+    """
+    text = _MD_INLINE.sub(r"\\\1", " ".join(str(text).split()))
+    return _MD_BLOCK_MARKER.sub(lambda m: m.group(1)[:-1] + "\\" + m.group(1)[-1], text)
+
+
+def render_markdown(itinerary: Dict[str, Any], title: str = "Travel Itinerary") -> str:
+    lines = [f"# {_md_escape(title)}", ""]
+    for day in itinerary.get("days", []):
+        lines += [f"## Day {_md_escape(day.get('day', ''))}", ""]
+        sections = day.get("sections", {})
+        for name in SECTIONS:
+            activities = sections.get(name) or []
+            if not activities:
+                continue
+            lines += [f"### {name.capitalize()}", ""]
+            lines += [f"- {_md_escape(a)}" for a in activities]
+            lines.append("")
+    summary = itinerary.get("summary")
+    if summary:
+        lines += ["## Summary", "", _md_escape(summary), ""]
+    return "\n".join(lines)
+
+
+# ---------- iCalendar ----------
+
+def parse_clock_hour(value: Optional[str], end: bool = False) -> Optional[float]:
+    """
+    "9 AM" / "9:30 pm" / "12 AM" / "21:00" -> hours after midnight.
+    Midnight ("12 AM", "0:00") is 0 as a start time and 24 as an end
+    time (end=True). None if unparseable.
+    """
+    if not value:
+        return None
+    match = re.search(r"(\d{1,2})(?::(\d{2}))?\s*([AaPp]\.?[Mm]\.?)?", value)
+    if not match:
+        return None
+    hour = int(match.group(1))
+    minute = int(match.group(2) or 0)
+    meridiem = (match.group(3) or "").lower().replace(".", "")
+    if meridiem == "am" and hour == 12:
+        hour = 0
+    elif meridiem == "pm" and hour != 12:
+        hour += 12
+    if hour > 24 or minute > 59:
+        return None
+    if end and hour == 0 and minute == 0:
+        hour = 24
+    return hour + minute / 60
+
+
+def section_windows(
+    start_time_preference: Optional[str],
+    end_time_preference: Optional[str],
+) -> Dict[str, Tuple[float, float]]:
+    """
+    Maps morning/afternoon/evening to (start, end) hours for one day,
+    using the questionnaire's daily start/end preferences.
+    """
+    start = parse_clock_hour(start_time_preference)
+    end = parse_clock_hour(end_time_preference, end=True)
+    if start is None or start >= 23:
+        start = DEFAULT_START_HOUR
+    if end is None or end <= start + 1:
+        end = min(24.0, max(DEFAULT_END_HOUR, start + 3))
+
+    morning_end = min(max(start + 1, AFTERNOON_START_HOUR), end)
+    evening_start = max(morning_end, min(EVENING_START_HOUR, end - 1))
+    return {
+        "morning": (start, morning_end),
+        "afternoon": (morning_end, evening_start),
+        "evening": (evening_start, end),
+    }
+
+
+def _ics_escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """
+    RFC 5545 line folding at 75 octets.
+    """
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    chunks, current = [], b""
+    for ch in line:
+        b = ch.encode("utf-8")
+        if len(current) + len(b) > (75 if not chunks else 74):
+            chunks.append(current.decode("utf-8"))
+            current = b""
+        current += b
+    chunks.append(current.decode("utf-8"))
+    return "\r\n ".join(chunks)
+
+
+def _local_time(day: date, hours: float) -> str:
+    moment = datetime.combine(day, datetime.min.time()) + timedelta(hours=hours)
+    return moment.strftime("%Y%m%dT%H%M%S")
+
+
+def render_ics(
+    itinerary: Dict[str, Any],
+    start_time_preference: Optional[str] = None,
+    end_time_preference: Optional[str] = None,
+    start_date: Optional[date] = None,
+    uid_prefix: str = "itinerary",
+) -> str:
+    """
+    One event per non-empty section per day, with the activities in the
+    description. Times are floating (local to the destination) since the
+    destination's time zone is not known. Without a start date the
+    calendar starts tomorrow.
+    """
+    first_day = start_date or (date.today() + timedelta(days=1))
+    windows = section_windows(start_time_preference, end_time_preference)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//AI Trip Itinerary Generator//EN",
+        "CALSCALE:GREGORIAN",
+    ]
+    for index, day in enumerate(itinerary.get("days", [])):
+        day_date = first_day + timedelta(days=index)
+        sections = day.get("sections", {})
+        for name in SECTIONS:
+            activities = sections.get(name) or []
+            if not activities:
+                continue
+            begin, finish = windows[name]
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{uid_prefix}-{index + 1}-{name}@trip-itinerary-generator",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART:{_local_time(day_date, begin)}",
+                f"DTEND:{_local_time(day_date, max(begin, finish))}",
+                _fold("SUMMARY:" + _ics_escape(f"Day {day.get('day', index + 1)} {name}: {activities[0]}")),
+                _fold("DESCRIPTION:" + _ics_escape("\n".join(f"- {a}" for a in activities))),
+                "END:VEVENT",
+            ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+# ---------- PDF ----------
+
+def render_pdf_bytes(itinerary: Dict[str, Any]) -> bytes:
+    # Imported here so the lightweight formats never load reportlab.
+    from .pdf_generator import generate_itinerary_pdf
+
+    buffer = io.BytesIO()
+    generate_itinerary_pdf(itinerary, buffer)
+    return buffer.getvalue()
+
+
+# ---------- Cache ----------
+
+class RenderCache:
+    """
+    LRU cache of rendered bodies keyed by (itinerary_id, format, options),
+    bounded by total size in bytes.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return body
+
+    def put(self, key: tuple, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def render(
+    itinerary: Dict[str, Any],
+    fmt: str,
+    context: Optional[Dict[str, Any]] = None,
+    start_date: Optional[date] = None,
+    uid_prefix: str = "itinerary",
+) -> bytes:
+    """
+    Renders one format to bytes. `context` supplies the questionnaire
+    answers the calendar needs (daily start/end preferences).
+    """
+    context = context or {}
+    if fmt == "html":
+        return render_html(itinerary).encode("utf-8")
+    if fmt == "markdown":
+        return render_markdown(itinerary).encode("utf-8")
+    if fmt == "ics":
+        return render_ics(
+            itinerary,
+            display_time(context, "start"),
+            display_time(context, "end"),
+            start_date,
+            uid_prefix,
+        ).encode("utf-8")
+    if fmt == "pdf":
+        return render_pdf_bytes(itinerary)
+    raise ValueError(f"Unsupported format {fmt!r}")
+
+
+def display_time(context: Dict[str, Any], which: str) -> Optional[str]:
+    """
+    start/end time preference, resolving "Other" to its free-text answer.
+    """
+    value = context.get(f"{which}_time_preference")
+    if value == "Other":
+        return context.get(f"{which}_time_other_text")
+    return value
+
+
+# Benchmark against PDF rendering; not used by FastAPI
+if __name__ == "__main__":
+    import timeit
+
+    sample = {
+        "days": [
+            {
+                "day": d,
+                "sections": {
+                    "morning": [f"Visit museum number {d}", "Coffee at a local cafe"],
+                    "afternoon": [f"Explore the old town district {d}", "Lunch at the market"],
+                    "evening": ["Dinner at a seafood restaurant", "Sunset walk on the pier"],
+                },
+            }
+            for d in range(1, 8)
+        ],
+        "summary": "A relaxed week of museums, markets and coastal evenings.",
+    }
+    context = {"start_time_preference": "9 AM", "end_time_preference": "9 PM"}
+    cache = RenderCache()
+
+    print(f"{'format':<10}{'ms/render':>12}{'bytes':>10}")
+    for fmt in ("html", "markdown", "ics", "pdf"):
+        runs = 20 if fmt == "pdf" else 500
+        seconds = timeit.timeit(lambda: render(sample, fmt, context), number=runs)
+        print(f"{fmt:<10}{seconds / runs * 1000:>12.3f}{len(render(sample, fmt, context)):>10}")
+
+    cache.put(("sample", "pdf"), render(sample, "pdf", context))
+    runs = 10000
+    seconds = timeit.timeit(lambda: cache.get(("sample", "pdf")), number=runs)
+    print(f"{'cached':<10}{seconds / runs * 1000:>12.4f}")
@@ -0,0 +1,250 @@
+"""
+Node-wide cache shared by every worker process.
+
+With several uvicorn workers, in-process caches hold one copy per worker
+and each only sees the requests routed to it. SharedCache keeps entries
+in the itinerary store's SQLite database instead (WAL mode, so readers
+never block), so all workers on a node read and write the same entries:
+the hit rate and the memory used do not depend on the worker count.
+Hit/miss counters live in the database too, so stats are node-wide. Reads
+never write: counters and LRU touches are gathered in memory and written
+in one short transaction every few seconds, so lookups from every worker
+do not queue behind SQLite's single writer.
+
+Also here: a file lock that elects one worker to run node-wide background
+jobs (pre-warming) instead of every worker running its own copy.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no multi-worker support, every process leads
+    fcntl = None
+
+# last_used is only rewritten when older than this, so hot reads stay reads.
+TOUCH_INTERVAL_SECONDS = 30
+
+# How often pending hit/miss counts and LRU touches are written.
+FLUSH_INTERVAL_SECONDS = 5
+
+
+class SharedCache:
+    """
+    Bytes cache in one namespace of the store's database, bounded by total
+    size (least recently used entries are evicted) and optionally by age.
+    Same get/put/stats interface as the in-process RenderCache.
+    """
+
+    def __init__(
+        self,
+        store,
+        namespace: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.store = store
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._pending_hits = 0
+        self._pending_misses = 0
+        self._pending_touches: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+
+        with self.store.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS shared_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_shared_cache_lru "
+                "ON shared_cache (namespace, last_used)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS shared_cache_stats (
+                    namespace TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO shared_cache_stats (namespace) VALUES (?)",
+                (namespace,),
+            )
+
+    @staticmethod
+    def _key(key) -> str:
+        return key if isinstance(key, str) else json.dumps(key, default=str)
+
+    def get(self, key, record: bool = True) -> Optional[bytes]:
+        """
+        Cached bytes for `key`, or None. record=False skips the hit/miss
+        counters (for polling).
+        """
+        now = time.time()
+        row = self.store.connection().execute(
+            "SELECT value, created_at, last_used FROM shared_cache WHERE namespace = ? AND key = ?",
+            (self.namespace, self._key(key)),
+        ).fetchone()
+        if row is not None and self.ttl_seconds is not None and now - row["created_at"] > self.ttl_seconds:
+            row = None
+
+        with self._lock:
+            if record:
+                if row is not None:
+                    self._pending_hits += 1
+                else:
+                    self._pending_misses += 1
+            if row is not None and now - row["last_used"] > TOUCH_INTERVAL_SECONDS:
+                self._pending_touches[self._key(key)] = now
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL_SECONDS
+        if due:
+            self.flush()
+        return None if row is None else bytes(row["value"])
+
+    def flush(self) -> None:
+        """
+        Writes the pending hit/miss counts and LRU touches.
+        """
+        with self._lock:
+            hits, misses, touches = self._pending_hits, self._pending_misses, self._pending_touches
+            self._pending_hits = self._pending_misses = 0
+            self._pending_touches = {}
+            self._last_flush = time.monotonic()
+        if not (hits or misses or touches):
+            return
+        with self.store.connection() as conn:
+            if hits or misses:
+                conn.execute(
+                    "UPDATE shared_cache_stats SET hits = hits + ?, misses = misses + ? WHERE namespace = ?",
+                    (hits, misses, self.namespace),
+                )
+            conn.executemany(
+                "UPDATE shared_cache SET last_used = MAX(last_used, ?) WHERE namespace = ? AND key = ?",
+                [(used, self.namespace, key) for key, used in touches.items()],
+            )
+
+    def put(self, key, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self.store.connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO shared_cache
+                    (namespace, key, value, size, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (self.namespace, self._key(key), value, len(value), now, now),
+            )
+            if self.ttl_seconds is not None:
+                conn.execute(
+                    "DELETE FROM shared_cache WHERE namespace = ? AND created_at < ?",
+                    (self.namespace, now - self.ttl_seconds),
+                )
+            total = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM shared_cache WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                evicted = 0
+                for row in conn.execute(
+                    "SELECT key, size FROM shared_cache WHERE namespace = ? ORDER BY last_used",
+                    (self.namespace,),
+                ).fetchall():
+                    if evicted >= excess:
+                        break
+                    conn.execute(
+                        "DELETE FROM shared_cache WHERE namespace = ? AND key = ?",
+                        (self.namespace, row["key"]),
+                    )
+                    evicted += row["size"]
+
+    def delete(self, key) -> None:
+        with self.store.connection() as conn:
+            conn.execute(
+                "DELETE FROM shared_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, self._key(key)),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        self.flush()
+        conn = self.store.connection()
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM shared_cache WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        hits, misses = conn.execute(
+            "SELECT hits, misses FROM shared_cache_stats WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        lookups = hits + misses
+        return {
+            "shared": True,
+            "entries": entries,
+            "bytes": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LeaderLock:
+    """
+    Non-blocking exclusive lock on a file; the worker holding it runs
+    node-wide background jobs. Released when the process exits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self._file is not None:
+                return True
+            if fcntl is None:
+                return True
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handle = open(self.path, "a+")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            handle.seek(0)
+            handle.truncate()
+            handle.write(str(os.getpid()))
+            handle.flush()
+            self._file = handle
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+                self._file.close()
+                self._file = None
@@ -0,0 +1,259 @@
+"""
+Near-duplicate questionnaire reuse.
+
+Two requests are considered the same trip when all structured answers match
+exactly (one bucket) and their free-text answers are similar enough, e.g.
+"lots of museums and amusement parks" vs "museums + theme parks". Text
+similarity is the Jaccard similarity of normalized word sets, estimated
+with MinHash and looked up through LSH bands stored next to the
+itineraries in SQLite. No external embedding service is involved.
+"""
+
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Free-text answers compared by similarity; every other questionnaire field
+# must match exactly.
+TEXT_FIELDS = (
+    "discovery_intent",
+    "interests",
+    "must_do",
+    "additional_notes",
+    "trip_purpose",
+    "desired_feelings",
+)
+
+# Request plumbing that does not change what the itinerary should be.
+IGNORED_FIELDS = ("shortlist_id", "prefetch_top_candidate")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "do", "for", "from",
+    "i", "if", "in", "into", "is", "it", "its", "like", "lot", "lots", "me", "my",
+    "of", "on", "or", "our", "place", "places", "so", "some", "that", "the",
+    "there", "to", "us", "want", "wants", "we", "where", "with", "would", "plenty",
+    "many", "go", "going", "visit", "see", "love", "enjoy", "really",
+}
+
+# Small hand-kept synonym map; both sides are normalized to the value.
+SYNONYMS = {
+    "theme": "amusement",
+    "themepark": "amusement",
+    "gallery": "museum",
+    "eatery": "restaurant",
+    "eat": "food",
+    "dining": "food",
+    "cuisine": "food",
+    "hike": "hiking",
+    "trail": "hiking",
+    "trek": "hiking",
+    "shore": "beach",
+    "coast": "beach",
+    "shop": "shopping",
+    "store": "shopping",
+    "mall": "shopping",
+    "bar": "nightlife",
+    "club": "nightlife",
+    "pub": "nightlife",
+    "photo": "photography",
+    "picture": "photography",
+    "relax": "relaxing",
+    "chill": "relaxing",
+    "romance": "romantic",
+    "anniversary": "romantic",
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def text_tokens(ctx: Dict[str, Any]) -> set:
+    """
+    Normalized word set over all free-text answers.
+    """
+    parts = []
+    for field in TEXT_FIELDS:
+        value = ctx.get(field)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value)
+        elif value:
+            parts.append(str(value))
+
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+", " ".join(parts).lower()):
+        if word in STOPWORDS:
+            continue
+        word = _stem(word)
+        tokens.add(SYNONYMS.get(word, word))
+    return tokens
+
+
+def structured_bucket(ctx: Dict[str, Any]) -> str:
+    """
+    Exact-match key over every non-text questionnaire answer.
+    """
+    structured = {}
+    for field, value in sorted(ctx.items()):
+        if field in TEXT_FIELDS or field in IGNORED_FIELDS or value is None:
+            continue
+        if isinstance(value, str):
+            value = " ".join(value.lower().split())
+        elif isinstance(value, list):
+            value = sorted(" ".join(str(v).lower().split()) for v in value)
+        structured[field] = value
+    canonical = json.dumps(structured, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class MinHasher:
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, tokens: Iterable[str]) -> List[int]:
+        hashes = [
+            struct.unpack("<I", hashlib.blake2b(t.encode("utf-8"), digest_size=4).digest())[0]
+            for t in tokens
+        ]
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._params
+        ]
+
+
+def estimated_jaccard(sig_a: List[int], sig_b: List[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class SimilarityIndex:
+    """
+    Bucketed MinHash/LSH index kept in the itinerary store's database.
+    """
+
+    def __init__(self, store, threshold: float = 0.8, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.store = store
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+
+        with self.store.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS similarity_entries (
+                    itinerary_id TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (bucket, itinerary_id)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS similarity_bands (
+                    bucket TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    band_hash TEXT NOT NULL,
+                    itinerary_id TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_similarity_bands "
+                "ON similarity_bands (bucket, band, band_hash)"
+            )
+
+    def _band_hashes(self, signature: List[int]) -> List[str]:
+        return [
+            hashlib.sha1(
+                json.dumps(signature[i * self.rows:(i + 1) * self.rows]).encode("utf-8")
+            ).hexdigest()
+            for i in range(self.bands)
+        ]
+
+    def add(self, itinerary_id: str, ctx: Dict[str, Any]) -> None:
+        bucket = structured_bucket(ctx)
+        signature = self.hasher.signature(text_tokens(ctx))
+        with self.store.connection() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO similarity_entries VALUES (?, ?, ?, ?)",
+                (itinerary_id, bucket, json.dumps(signature), time.time()),
+            ).rowcount
+            if inserted:
+                conn.executemany(
+                    "INSERT INTO similarity_bands VALUES (?, ?, ?, ?)",
+                    [
+                        (bucket, band, band_hash, itinerary_id)
+                        for band, band_hash in enumerate(self._band_hashes(signature))
+                    ],
+                )
+
+    def lookup(self, ctx: Dict[str, Any]) -> Optional[Tuple[str, float]]:
+        """
+        Best stored (itinerary_id, similarity) at or above the threshold.
+        """
+        bucket = structured_bucket(ctx)
+        signature = self.hasher.signature(text_tokens(ctx))
+        band_hashes = self._band_hashes(signature)
+
+        conn = self.store.connection()
+        candidates = conn.execute(
+            f"""
+            SELECT DISTINCT e.itinerary_id, e.signature, e.created_at
+            FROM similarity_bands b
+            JOIN similarity_entries e
+              ON e.bucket = b.bucket AND e.itinerary_id = b.itinerary_id
+            WHERE b.bucket = ? AND ({" OR ".join(["(b.band = ? AND b.band_hash = ?)"] * self.bands)})
+            """,
+            [bucket] + [v for band, h in enumerate(band_hashes) for v in (band, h)],
+        ).fetchall()
+
+        best = None
+        for row in candidates:
+            score = estimated_jaccard(signature, json.loads(row["signature"]))
+            if score >= self.threshold and (
+                best is None or (score, row["created_at"]) > (best[1], best[2])
+            ):
+                best = (row["itinerary_id"], score, row["created_at"])
+
+        with self._lock:
+            self._lookups += 1
+            if best is not None:
+                self._hits += 1
+
+        return (best[0], best[1]) if best is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": round(self._hits / self._lookups, 4) if self._lookups else 0.0,
+            }
@@ -0,0 +1,413 @@
+"""
+Streaming structural validation of itinerary output.
+
+The model output is checked character by character against the shape that
+parse_and_validate_itinerary() accepts. As soon as the text can no longer
+become a valid itinerary (prose, "Day 1:" headings, wrong types, a day
+without sections, trailing text...) the upstream stream is closed so we
+stop paying for and waiting on a completion that json.loads would reject.
+"""
+
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SECTION_KEYS = ("morning", "afternoon", "evening")
+
+# role -> key -> (expected container type, child role)
+# "any" accepts any JSON value; unknown keys are allowed because the final
+# validator tolerates them.
+_OBJECT_SCHEMA = {
+    "root": {"days": ("array", "days"), "summary": ("any", None)},
+    "day": {"day": ("any", None), "sections": ("object", "sections")},
+    "sections": {key: ("array", "activities") for key in SECTION_KEYS},
+}
+_ARRAY_ITEMS = {
+    "days": ("object", "day"),
+    "activities": ("any", None),
+}
+_REQUIRED_KEYS = {
+    "root": {"days", "summary"},
+    "day": {"day", "sections"},
+    "sections": set(SECTION_KEYS),
+}
+
+_NUMBER_RE = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?$")
+_LITERALS = ("true", "false", "null")
+_LITERAL_START = set("-0123456789tfn")
+_WHITESPACE = " \t\r\n"
+
+# A leading ```json fence is the one deviation we repair instead of aborting.
+_FENCE_OPENER = "```json"
+
+
+class _Frame:
+    __slots__ = ("kind", "role", "state", "key", "seen")
+
+    def __init__(self, kind: str, role: Optional[str]):
+        self.kind = kind
+        self.role = role
+        self.state = "key_or_end" if kind == "object" else "value_or_end"
+        self.key: Optional[str] = None
+        self.seen = set()
+
+
+class StreamingItineraryValidator:
+    """
+    Incremental checker. Call feed() with each text delta; it returns False
+    (and sets `error`) the moment the output cannot become valid.
+    """
+
+    def __init__(self):
+        self.error: Optional[str] = None
+        self.chars_seen = 0
+        self.fenced = False
+        self._prefix = ""
+        self._started = False
+        self._done = False
+        self._stack = []
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._key_chars = []
+        self._literal = []
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def _fail(self, reason: str) -> bool:
+        self.error = reason
+        return False
+
+    def feed(self, text: str) -> bool:
+        if self.error is not None:
+            return False
+        for ch in text:
+            self.chars_seen += 1
+            if not self._started:
+                if not self._start(ch):
+                    return False
+                continue
+            if not self._step(ch):
+                return False
+        return True
+
+    def finish(self) -> bool:
+        """
+        Call once the stream has ended; False if the output is incomplete.
+        """
+        if self.error is not None:
+            return False
+        if self._literal and not self._end_literal():
+            return False
+        if not self._done:
+            return self._fail("Output ended before the JSON object was complete")
+        return True
+
+    # ---------- prefix handling ----------
+
+    def _start(self, ch: str) -> bool:
+        self._prefix += ch
+        stripped = self._prefix.lstrip()
+        if not stripped:
+            return True
+        if stripped == "{":
+            self._started = True
+            return self._open_value("{")
+        if not self.fenced and "```".startswith(stripped[:3]):
+            if "\n" not in stripped:
+                if _FENCE_OPENER.startswith(stripped.lower()):
+                    return True
+                return self._fail("Unexpected text in markdown fence")
+            if stripped.split("\n", 1)[0].strip().lower() in ("```", _FENCE_OPENER):
+                self.fenced = True
+                self._prefix = ""
+                return True
+            return self._fail("Unexpected text in markdown fence")
+        return self._fail(f"Output does not start with a JSON object: {stripped[:20]!r}")
+
+    # ---------- main state machine ----------
+
+    def _step(self, ch: str) -> bool:
+        if self._in_string:
+            return self._string_char(ch)
+
+        if self._literal:
+            if ch in _WHITESPACE or ch in ",]}":
+                if not self._end_literal():
+                    return False
+            else:
+                self._literal.append(ch)
+                return self._check_literal_prefix()
+
+        if self._done:
+            if ch in _WHITESPACE:
+                return True
+            if self.fenced and ch == "`":
+                return True
+            return self._fail("Unexpected text after the JSON object")
+
+        if ch in _WHITESPACE:
+            return True
+
+        frame = self._stack[-1]
+
+        if frame.kind == "object":
+            if frame.state in ("key_or_end", "key"):
+                if ch == '"':
+                    self._in_string = True
+                    self._string_is_key = True
+                    self._key_chars = []
+                    return True
+                if ch == "}" and frame.state == "key_or_end":
+                    return self._close("}")
+                return self._fail("Expected an object key")
+            if frame.state == "colon":
+                if ch != ":":
+                    return self._fail("Expected ':' after key")
+                frame.state = "value"
+                return True
+            if frame.state == "value":
+                return self._open_value(ch)
+            if frame.state == "comma_or_end":
+                if ch == ",":
+                    frame.state = "key"
+                    return True
+                if ch == "}":
+                    return self._close("}")
+                return self._fail("Expected ',' or '}'")
+
+        else:
+            if frame.state == "value_or_end" and ch == "]":
+                return self._close("]")
+            if frame.state in ("value_or_end", "value"):
+                return self._open_value(ch)
+            if frame.state == "comma_or_end":
+                if ch == ",":
+                    frame.state = "value"
+                    return True
+                if ch == "]":
+                    return self._close("]")
+                return self._fail("Expected ',' or ']'")
+
+        return self._fail("Unexpected character")
+
+    def _expected(self):
+        """
+        (container type, role) expected for the value about to start.
+        """
+        if not self._stack:
+            return ("object", "root")
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            schema = _OBJECT_SCHEMA.get(frame.role)
+            if schema is None:
+                return ("any", None)
+            return schema.get(frame.key, ("any", None))
+        return _ARRAY_ITEMS.get(frame.role, ("any", None))
+
+    def _value_started(self) -> None:
+        if self._stack:
+            self._stack[-1].state = "comma_or_end"
+
+    def _open_value(self, ch: str) -> bool:
+        expected, role = self._expected()
+        if ch in "{[":
+            kind = "object" if ch == "{" else "array"
+            if expected not in ("any", kind):
+                return self._fail(f"Expected {expected}, got {kind}")
+            self._value_started()
+            self._stack.append(_Frame(kind, role))
+            return True
+        if expected != "any":
+            return self._fail(f"Expected {expected}")
+        if ch == '"':
+            self._value_started()
+            self._in_string = True
+            self._string_is_key = False
+            return True
+        if ch in _LITERAL_START:
+            self._value_started()
+            self._literal = [ch]
+            return True
+        return self._fail("Expected a JSON value")
+
+    def _close(self, ch: str) -> bool:
+        frame = self._stack.pop()
+        missing = _REQUIRED_KEYS.get(frame.role, set()) - frame.seen
+        if frame.kind == "object" and missing:
+            return self._fail(f"Missing required keys in {frame.role}: {sorted(missing)}")
+        if not self._stack:
+            self._done = True
+        return True
+
+    def _string_char(self, ch: str) -> bool:
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._string_is_key:
+                frame = self._stack[-1]
+                frame.key = "".join(self._key_chars)
+                frame.seen.add(frame.key)
+                frame.state = "colon"
+            return True
+        elif ord(ch) < 0x20:
+            return self._fail("Unescaped control character in string")
+        if self._string_is_key:
+            self._key_chars.append(ch)
+        return True
+
+    def _check_literal_prefix(self) -> bool:
+        text = "".join(self._literal)
+        if text[0] in "-0123456789":
+            if all(c in "0123456789+-.eE" for c in text):
+                return True
+            return self._fail("Malformed number")
+        if any(literal.startswith(text) for literal in _LITERALS):
+            return True
+        return self._fail("Malformed literal")
+
+    def _end_literal(self) -> bool:
+        text = "".join(self._literal)
+        self._literal = []
+        if text in _LITERALS or _NUMBER_RE.match(text):
+            return True
+        return self._fail(f"Malformed literal {text!r}")
+
+
+def strip_fence(text: str) -> str:
+    """
+    Removes a markdown code fence around an otherwise valid JSON object.
+    """
+    stripped = text.strip()
+    if stripped.startswith("```"):
+        stripped = stripped.split("\n", 1)[1] if "\n" in stripped else ""
+        if stripped.rstrip().endswith("```"):
+            stripped = stripped.rstrip()[:-3]
+    return stripped.strip()
+
+
+class StreamResult:
+    __slots__ = ("text", "finish_reason", "aborted", "error", "elapsed", "chars")
+
+    def __init__(self):
+        self.text = ""
+        self.finish_reason: Optional[str] = None
+        self.aborted = False
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+        self.chars = 0
+
+
+def consume_choices(
+    stream,
+    validators: List[StreamingItineraryValidator],
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Tuple[List[StreamResult], Any]:
+    """
+    Reads a stream of several choices (n > 1), one validator per choice
+    index. A choice that fails validation is marked aborted and ignored;
+    reading stops once every choice has failed (or should_stop() returns
+    True), as a single choice cannot be cancelled. The upstream stream is
+    always closed on the way out, including when reading raises.
+
+    Returns one result per choice and the usage of the whole completion.
+    """
+    results = [StreamResult() for _ in validators]
+    parts: List[List[str]] = [[] for _ in validators]
+    usage = None
+    started = time.monotonic()
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            for choice in chunk.choices or ():
+                index = getattr(choice, "index", 0) or 0
+                if index >= len(results) or results[index].aborted:
+                    continue
+                result, validator = results[index], validators[index]
+                delta = choice.delta.content if choice.delta is not None else None
+                if delta:
+                    parts[index].append(delta)
+                    if not validator.feed(delta):
+                        result.aborted = True
+                        result.error = validator.error
+                        continue
+                if choice.finish_reason:
+                    result.finish_reason = choice.finish_reason
+            if all(result.aborted for result in results):
+                break
+            if should_stop is not None and should_stop():
+                for result in results:
+                    if not result.aborted:
+                        result.aborted = True
+                        result.error = "Stopped by caller"
+                break
+    finally:
+        stream.close()
+
+    elapsed = time.monotonic() - started
+    for result, validator, text in zip(results, validators, parts):
+        result.text = "".join(text)
+        result.chars = len(result.text)
+        result.elapsed = elapsed
+        if not result.aborted and not validator.finish():
+            result.error = validator.error
+        elif validator.fenced:
+            result.text = strip_fence(result.text)
+    return results, usage
+
+
+class StreamAbortStats:
+    """
+    Running totals of early aborts and what they saved.
+
+    Savings are estimates: the tokens we would have waited for are the
+    expected completion size minus what was emitted before the abort
+    (~4 characters per token), and the time is that remainder at the
+    observed emission rate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "streams": 0,
+            "aborted": 0,
+            "repaired": 0,
+            "retries": 0,
+            "estimated_tokens_saved": 0,
+            "estimated_seconds_saved": 0.0,
+        }
+
+    def record(self, result: StreamResult, expected_tokens: int, repaired: bool = False) -> None:
+        """
+        repaired: the output was fenced and parsed as an itinerary once the
+        fence was stripped.
+        """
+        with self._lock:
+            self._stats["streams"] += 1
+            if repaired:
+                self._stats["repaired"] += 1
+            if not result.aborted:
+                return
+            self._stats["aborted"] += 1
+            emitted = result.chars / 4
+            remaining = max(0.0, expected_tokens - emitted)
+            self._stats["estimated_tokens_saved"] += int(remaining)
+            if emitted and result.elapsed:
+                self._stats["estimated_seconds_saved"] += remaining * result.elapsed / emitted
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self._stats["retries"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["estimated_seconds_saved"] = round(stats["estimated_seconds_saved"], 2)
+        return stats
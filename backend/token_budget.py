@@ -0,0 +1,228 @@
+"""
+Per-request max_tokens budgeting.
+
+Predicts completion size from the trip shape (days, schedule_style,
+trip_mode) and learns from the completion token counts of past calls.
+Too small a budget truncates the JSON (wasted call); too large a budget
+reserves tokens-per-minute capacity we never use.
+
+The history file keeps only the most recent samples per shape (older ones
+no longer move the smoothed estimate), so startup replay stays short.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker, no cross-process locking
+    fcntl = None
+
+# Starting guesses for completion tokens per itinerary day, before any
+# observations exist for a shape. Roughly 3 sections x 2-4 short sentences.
+DEFAULT_TOKENS_PER_DAY = {
+    "Packed": 240,
+    "Somewhere in between": 190,
+    "Relaxed": 150,
+}
+FALLBACK_TOKENS_PER_DAY = 200
+
+# Unknown trip length (discover mode with dates only): plan for a week.
+DEFAULT_DAYS = 7
+
+# Samples kept per shape in the history file. With smoothing 0.2 the oldest
+# of 200 samples carries a weight of 0.8**200, i.e. nothing.
+HISTORY_SAMPLES_PER_SHAPE = 200
+
+# The history file is compacted again after this many appends.
+HISTORY_COMPACT_EVERY = 1000
+
+
+class TokenBudgeter:
+    """
+    Learns tokens-per-day for each (trip_mode, schedule_style) and sizes
+    max_tokens as: overhead + days * tokens_per_day * safety_margin.
+    """
+
+    def __init__(
+        self,
+        overhead_tokens: int = 120,
+        safety_margin: float = 1.25,
+        min_tokens: int = 300,
+        max_tokens: int = 16000,
+        smoothing: float = 0.2,
+        history_path: Optional[str] = None,
+    ):
+        self.overhead_tokens = overhead_tokens
+        self.safety_margin = safety_margin
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.smoothing = smoothing
+        self.history_path = history_path
+
+        self._lock = threading.Lock()
+        self._per_day: Dict[Tuple[str, str], float] = {}
+        self._shape_stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._totals = {"calls": 0, "truncated": 0, "over_allocation_sum": 0.0, "over_allocation_calls": 0}
+        self._appended = 0
+
+        if history_path and os.path.exists(history_path):
+            for record in self._compact_history():
+                self.record(persist=False, **record)
+
+    @staticmethod
+    def _shape(trip_mode: Optional[str], schedule_style: Optional[str]) -> Tuple[str, str]:
+        return (trip_mode or "unknown", schedule_style or "Not specified")
+
+    def predict(self, days: Optional[int], schedule_style: Optional[str], trip_mode: Optional[str]) -> int:
+        """
+        Returns the max_tokens value to send for this trip shape.
+        """
+        shape = self._shape(trip_mode, schedule_style)
+        with self._lock:
+            per_day = self._per_day.get(
+                shape, DEFAULT_TOKENS_PER_DAY.get(schedule_style, FALLBACK_TOKENS_PER_DAY)
+            )
+        budget = self.overhead_tokens + (days or DEFAULT_DAYS) * per_day * self.safety_margin
+        return int(min(self.max_tokens, max(self.min_tokens, budget)))
+
+    def record(
+        self,
+        days: Optional[int],
+        schedule_style: Optional[str],
+        trip_mode: Optional[str],
+        max_tokens: int,
+        completion_tokens: int,
+        finish_reason: Optional[str],
+        persist: bool = True,
+    ) -> None:
+        """
+        Feeds one observed completion back into the estimate.
+        A truncated call ("length") only tells us the real size is larger,
+        so the estimate is pushed up instead of averaged in.
+        """
+        shape = self._shape(trip_mode, schedule_style)
+        truncated = finish_reason == "length"
+        observed_per_day = max(0, completion_tokens - self.overhead_tokens) / (days or DEFAULT_DAYS)
+
+        with self._lock:
+            current = self._per_day.get(
+                shape, DEFAULT_TOKENS_PER_DAY.get(schedule_style, FALLBACK_TOKENS_PER_DAY)
+            )
+            if truncated:
+                self._per_day[shape] = max(current, observed_per_day) * 1.25
+            else:
+                self._per_day[shape] = (1 - self.smoothing) * current + self.smoothing * observed_per_day
+
+            shape_stats = self._shape_stats.setdefault(
+                shape, {"calls": 0, "truncated": 0, "over_allocation_sum": 0.0, "over_allocation_calls": 0}
+            )
+            for stats in (shape_stats, self._totals):
+                stats["calls"] += 1
+                if truncated:
+                    stats["truncated"] += 1
+                elif max_tokens:
+                    stats["over_allocation_sum"] += (max_tokens - completion_tokens) / max_tokens
+                    stats["over_allocation_calls"] += 1
+
+        if persist and self.history_path:
+            self._append_history({
+                "days": days,
+                "schedule_style": schedule_style,
+                "trip_mode": trip_mode,
+                "max_tokens": max_tokens,
+                "completion_tokens": completion_tokens,
+                "finish_reason": finish_reason,
+            })
+
+    @staticmethod
+    def _summarize(stats: Dict[str, float]) -> Dict[str, Any]:
+        calls = stats["calls"]
+        return {
+            "calls": calls,
+            "truncation_rate": round(stats["truncated"] / calls, 4) if calls else 0.0,
+            "mean_over_allocation": (
+                round(stats["over_allocation_sum"] / stats["over_allocation_calls"], 4)
+                if stats["over_allocation_calls"] else 0.0
+            ),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Truncation rate and mean over-allocation (unused share of max_tokens
+        on calls that finished normally), overall and per trip shape.
+        """
+        with self._lock:
+            return {
+                **self._summarize(self._totals),
+                "shapes": [
+                    {
+                        "trip_mode": shape[0],
+                        "schedule_style": shape[1],
+                        "tokens_per_day": round(self._per_day.get(shape, 0.0), 1),
+                        **self._summarize(stats),
+                    }
+                    for shape, stats in sorted(self._shape_stats.items())
+                ],
+            }
+
+    @contextmanager
+    def _history_lock(self) -> Iterator[None]:
+        """
+        Serializes history appends and rewrites across worker processes.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.history_path + ".lock", "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _append_history(self, record: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self.history_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            with self._history_lock():
+                with open(self.history_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            self._appended += 1
+            compact = self._appended >= HISTORY_COMPACT_EVERY
+            if compact:
+                self._appended = 0
+        if compact:
+            self._compact_history()
+
+    def _compact_history(self) -> List[Dict[str, Any]]:
+        """
+        Rewrites the history file with the last HISTORY_SAMPLES_PER_SHAPE
+        records of each shape, in their original order, and returns them.
+        """
+        with self._history_lock():
+            recent: Dict[Tuple[str, str], deque] = {}
+            total = 0
+            with open(self.history_path, encoding="utf-8") as f:
+                for position, line in enumerate(f):
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    total += 1
+                    shape = self._shape(record.get("trip_mode"), record.get("schedule_style"))
+                    recent.setdefault(shape, deque(maxlen=HISTORY_SAMPLES_PER_SHAPE)).append((position, record))
+            kept = sorted((item for samples in recent.values() for item in samples), key=lambda item: item[0])
+            records = [record for _, record in kept]
+            if len(records) < total:
+                temp_path = self.history_path + ".tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record) + "\n")
+                os.replace(temp_path, self.history_path)
+        return records
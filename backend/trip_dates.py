@@ -0,0 +1,395 @@
+"""
+Local parsing of the questionnaire's date fields.
+
+date_range ("July 10 to July 14") and time_constraints_detail ("July 12
+from 2:00 PM to 5:00 PM, July 13 from 9:00 AM to 11:00 AM") are free text
+in a fixed format. They are parsed here, before any model call, into
+concrete dates and time windows: malformed or contradictory values are
+rejected up front instead of burning a generation, and the prompt gets
+day-numbered fixed windows instead of text the model has to reason about.
+
+Years are optional; a date without one is its next occurrence (a range
+like "December 30 to January 2" crosses into the following year), except
+that a trip which has started but not ended keeps its current dates.
+"""
+
+import calendar
+import re
+from datetime import date, datetime, time
+from typing import List, Optional, Tuple
+
+# Longest trip the planner accepts, as for `days`.
+MAX_TRIP_DAYS = 30
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+MONTHS["sept"] = 9
+
+_MONTH_DAY = r"(?P<{p}month>[A-Za-z]+)\.?\s+(?P<{p}day>\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s*(?P<{p}year>\d{{4}}))?"
+_TIME = r"\d{1,2}(?::\d{2})?\s*(?:[AaPp]\.?\s?[Mm]\.?)?"
+_SEPARATOR = r"\s*(?:to|through|until|till|-|–|—)\s*"
+
+DATE_RANGE_RE = re.compile(
+    r"^\s*" + _MONTH_DAY.format(p="s") + _SEPARATOR
+    + r"(?:(?P<emonth>[A-Za-z]+)\.?\s+)?(?P<eday>\d{1,2})(?:st|nd|rd|th)?(?:,?\s*(?P<eyear>\d{4}))?\s*$"
+)
+WINDOW_RE = re.compile(
+    _MONTH_DAY.format(p="") + r"\s+from\s+(?P<start>" + _TIME + r")" + _SEPARATOR
+    + r"(?P<end>" + _TIME + r")"
+)
+TIME_RE = re.compile(r"^(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?:(?P<meridiem>[AaPp])\.?\s?[Mm]\.?)?$")
+
+# A window ending at midnight ("to 12:00 AM") ends with the day.
+END_OF_DAY = time.max
+
+DATE_RANGE_FORMAT = "'July 10 to July 14'"
+WINDOW_FORMAT = "'July 12 from 2:00 PM to 5:00 PM'"
+
+
+class DateParseError(ValueError):
+    """A date field is malformed or contradicts the rest of the request."""
+
+
+class TimeWindow:
+    __slots__ = ("day", "start", "end")
+
+    def __init__(self, day: date, start: time, end: time):
+        self.day = day
+        self.start = start
+        self.end = end
+
+
+class TripSchedule:
+    """
+    Parsed date fields of one request. start_date/end_date are None when
+    the trip has no dates; notes list every normalization applied.
+    """
+
+    __slots__ = ("start_date", "end_date", "windows", "notes")
+
+    def __init__(
+        self,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        windows: Optional[List[TimeWindow]] = None,
+        notes: Optional[List[str]] = None,
+    ):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.windows = windows or []
+        self.notes = notes or []
+
+    @property
+    def days(self) -> Optional[int]:
+        if self.start_date is None:
+            return None
+        return (self.end_date - self.start_date).days + 1
+
+    def day_number(self, day: date) -> Optional[int]:
+        if self.start_date is None:
+            return None
+        return (day - self.start_date).days + 1
+
+
+def _month(name: str, text: str) -> int:
+    month = MONTHS.get(name.lower())
+    if month is None:
+        raise DateParseError(f"Unknown month '{name}' in '{text}'")
+    return month
+
+
+def _date(year: int, month: int, day: int, text: str) -> date:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        raise DateParseError(f"Invalid date '{calendar.month_name[month]} {day}' in '{text}'")
+
+
+def _next_occurrence(month: int, day: int, today: date, text: str) -> date:
+    """The first date on or after `today` with this month and day."""
+    for year in range(today.year, today.year + 5):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            continue  # February 29 outside a leap year
+        if candidate >= today:
+            return candidate
+    raise DateParseError(f"Invalid date '{calendar.month_name[month]} {day}' in '{text}'")
+
+
+def parse_time(text: str, end: bool = False) -> time:
+    """
+    '2:00 PM', '2pm', '9:30 a.m.' or 24-hour '14:00'. Midnight ending a
+    window (end=True) is END_OF_DAY rather than the start of the day.
+    """
+    match = TIME_RE.match(text.strip())
+    if match is None:
+        raise DateParseError(f"Invalid time '{text}'")
+    hour = int(match["hour"])
+    minute = int(match["minute"] or 0)
+    meridiem = (match["meridiem"] or "").lower()
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise DateParseError(f"Invalid time '{text}'")
+        hour = hour % 12 + (12 if meridiem == "p" else 0)
+    if hour > 23 or minute > 59:
+        raise DateParseError(f"Invalid time '{text}'")
+    if end and hour == 0 and minute == 0:
+        return END_OF_DAY
+    return time(hour, minute)
+
+
+def parse_date_range(text: str, today: Optional[date] = None) -> Tuple[date, date]:
+    """
+    (start, end) inclusive from e.g. "July 10 to July 14", "Jul 10-14"
+    or "December 30, 2026 to January 2, 2027".
+    """
+    today = today or date.today()
+    match = DATE_RANGE_RE.match(text)
+    if match is None:
+        raise DateParseError(f"date_range must look like {DATE_RANGE_FORMAT}, got '{text}'")
+
+    start_month = _month(match["smonth"], text)
+    end_month = _month(match["emonth"], text) if match["emonth"] else start_month
+    start_day, end_day = int(match["sday"]), int(match["eday"])
+
+    def end_after(start: date) -> date:
+        end = _date(start.year, end_month, end_day, text)
+        if end < start:
+            end = _date(start.year + 1, end_month, end_day, text)
+        return end
+
+    if match["syear"]:
+        start = _date(int(match["syear"]), start_month, start_day, text)
+        end = _date(int(match["eyear"]), end_month, end_day, text) if match["eyear"] else end_after(start)
+    elif match["eyear"]:
+        end = _date(int(match["eyear"]), end_month, end_day, text)
+        start = _date(end.year, start_month, start_day, text)
+        if start > end:
+            start = _date(end.year - 1, start_month, start_day, text)
+    else:
+        # The earliest occurrence that has not ended yet, so a trip already
+        # under way keeps this year's (or, across New Year, last year's) dates.
+        start = end = None
+        for year in range(today.year - 1, today.year + 5):
+            candidate = _date_or_none(year, start_month, start_day)
+            if candidate is not None and end_after(candidate) >= today:
+                start, end = candidate, end_after(candidate)
+                break
+        if start is None:
+            start = _next_occurrence(start_month, start_day, today, text)
+            end = end_after(start)
+
+    if end < start:
+        raise DateParseError(f"date_range ends before it starts: '{text}'")
+    if end < today:
+        raise DateParseError(f"date_range is in the past: '{text}'")
+    return start, end
+
+
+def parse_time_constraints(
+    text: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    today: Optional[date] = None,
+) -> List[TimeWindow]:
+    """
+    Time windows from comma-separated "July 12 from 2:00 PM to 5:00 PM"
+    entries, sorted. With a trip date range, every window must fall inside
+    it (and a window without a year takes the range's year).
+    """
+    today = today or date.today()
+    windows = []
+    for match in WINDOW_RE.finditer(text):
+        entry = match.group(0)
+        month, day = _month(match["month"], entry), int(match["day"])
+        if match["year"]:
+            window_day = _date(int(match["year"]), month, day, entry)
+        elif start_date is not None:
+            in_range = [
+                d for d in (_date_or_none(year, month, day) for year in {start_date.year, end_date.year})
+                if d is not None and start_date <= d <= end_date
+            ]
+            window_day = in_range[0] if in_range else _date(start_date.year, month, day, entry)
+        else:
+            window_day = _next_occurrence(month, day, today, entry)
+
+        start, end = parse_time(match["start"]), parse_time(match["end"], end=True)
+        if end <= start:
+            raise DateParseError(f"Time constraint ends before it starts: '{entry}'")
+        if start_date is not None and not start_date <= window_day <= end_date:
+            raise DateParseError(
+                f"Time constraint '{entry}' is outside the trip dates "
+                f"({format_date_range(start_date, end_date)})"
+            )
+        windows.append(TimeWindow(window_day, start, end))
+
+    leftover = WINDOW_RE.sub(" ", text)
+    leftover = re.sub(r"[\s,;.]+|\band\b", " ", leftover).strip()
+    if leftover or not windows:
+        raise DateParseError(
+            f"time_constraints_detail entries must look like {WINDOW_FORMAT}, "
+            f"could not read '{leftover or text}'"
+        )
+    return sorted(windows, key=lambda w: (w.day, w.start))
+
+
+def _date_or_none(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def merge_windows(windows: List[TimeWindow]) -> Tuple[List[TimeWindow], List[date]]:
+    """
+    Sorted windows with overlapping ones on the same day merged.
+    Also returns the days where a merge happened.
+    """
+    merged: List[TimeWindow] = []
+    merged_days: List[date] = []
+    for window in windows:
+        last = merged[-1] if merged else None
+        if last is not None and last.day == window.day and window.start <= last.end:
+            last.end = max(last.end, window.end)
+            if window.day not in merged_days:
+                merged_days.append(window.day)
+        else:
+            merged.append(TimeWindow(window.day, window.start, window.end))
+    return merged, merged_days
+
+
+def trip_schedule(
+    date_range: Optional[str],
+    time_constraints: Optional[str],
+    days: Optional[int] = None,
+    today: Optional[date] = None,
+) -> TripSchedule:
+    """
+    Parses both fields and reconciles them with the requested day count.
+    The date range is authoritative: a conflicting `days` is reported in
+    the notes, and the caller should use schedule.days instead.
+    """
+    schedule = TripSchedule()
+    if date_range:
+        schedule.start_date, schedule.end_date = parse_date_range(date_range, today)
+        if schedule.days > MAX_TRIP_DAYS:
+            raise DateParseError(
+                f"date_range covers {schedule.days} days; trips can be at most {MAX_TRIP_DAYS} days"
+            )
+        if days is not None and days != schedule.days:
+            schedule.notes.append(
+                f"days changed from {days} to {schedule.days} to match date_range "
+                f"({format_date_range(schedule.start_date, schedule.end_date)})"
+            )
+
+    if time_constraints:
+        windows = parse_time_constraints(time_constraints, schedule.start_date, schedule.end_date, today)
+        schedule.windows, merged_days = merge_windows(windows)
+        for day in merged_days:
+            schedule.notes.append(f"Overlapping time constraints on {_month_day(day)} were merged")
+        if schedule.start_date is None and days is not None:
+            span = (schedule.windows[-1].day - schedule.windows[0].day).days + 1
+            if span > days:
+                raise DateParseError(
+                    f"Time constraints span {span} days but the trip is {days} days long"
+                )
+    return schedule
+
+
+# ---------- Formatting ----------
+
+def _month_day(day: date) -> str:
+    return f"{calendar.month_name[day.month]} {day.day}"
+
+
+def _weekday_date(day: date) -> str:
+    return f"{calendar.day_name[day.weekday()]}, {_month_day(day)}, {day.year}"
+
+
+def format_time(value: time) -> str:
+    if value == END_OF_DAY:
+        return "12:00 AM"
+    return datetime.combine(date.min, value).strftime("%I:%M %p").lstrip("0")
+
+
+def format_date_range(start: date, end: date) -> str:
+    """
+    Canonical date_range text, e.g. "July 10, 2027 to July 14, 2027".
+    Years are explicit so re-parsing it later gives the same dates.
+    """
+    return f"{_month_day(start)}, {start.year} to {_month_day(end)}, {end.year}"
+
+
+def format_time_constraints(windows: List[TimeWindow]) -> str:
+    """Canonical time_constraints_detail text, with explicit years."""
+    return ", ".join(
+        f"{_month_day(w.day)}, {w.day.year} from {format_time(w.start)} to {format_time(w.end)}"
+        for w in windows
+    )
+
+
+def describe_dates(schedule: TripSchedule) -> str:
+    """Prompt line for the trip dates, with weekdays and the day count."""
+    if schedule.start_date is None:
+        return "Not specified"
+    return (
+        f"{_weekday_date(schedule.start_date)} to {_weekday_date(schedule.end_date)} "
+        f"({schedule.days} days; Day 1 = {calendar.day_name[schedule.start_date.weekday()]})"
+    )
+
+
+def describe_windows(schedule: TripSchedule) -> str:
+    """Prompt lines for the fixed time windows, by itinerary day."""
+    if not schedule.windows:
+        return "None"
+    lines = []
+    for window in schedule.windows:
+        number = schedule.day_number(window.day)
+        label = f"Day {number} ({_weekday_date(window.day)})" if number else _weekday_date(window.day)
+        lines.append(
+            f"- {label}: fixed commitment {format_time(window.start)} to {format_time(window.end)}; "
+            "keep this window free"
+        )
+    return "\n" + "\n".join(lines)
+
+
+# Quick local check; not used by FastAPI.
+# python -m backend.trip_dates
+if __name__ == "__main__":
+    import sys
+    import time as timer
+
+    today = date(2026, 6, 1)
+    checks = [
+        ("July 10 to July 14", "July 12 from 2:00 PM to 5:00 PM", 5, None),
+        ("Jul 10-14", "jul 12 from 2pm to 5pm, July 12 from 4:00 PM to 6:00 PM", 3, None),
+        ("December 30 to January 2", "January 1 from 10:00 AM to 1:00 PM", None, None),
+        ("July 40 to July 44", None, None, "Invalid date"),
+        ("next week", None, None, "date_range must look like"),
+        ("July 10 to July 14", "July 20 from 2:00 PM to 5:00 PM", None, "outside the trip dates"),
+        ("July 10 to July 14", "July 12 from 5:00 PM to 2:00 PM", None, "ends before it starts"),
+        ("July 10 to July 14", "July 12 from 2:00 PM to 12:00 AM", None, None),
+        ("May 30 to June 3", None, None, None),  # under way on June 1: stays in 2026
+        ("December 30, 2026 to January 2", None, None, None),
+        ("July 10 to July 14", "July 12 at lunch", None, "could not read"),
+        ("June 1 to August 1", None, None, "at most"),
+    ]
+    failed = False
+    for date_range, constraints, days, error in checks:
+        try:
+            schedule = trip_schedule(date_range, constraints, days, today)
+            outcome = f"{describe_dates(schedule)} | {format_time_constraints(schedule.windows)} | {schedule.notes}"
+            ok = error is None
+        except DateParseError as e:
+            outcome = f"rejected: {e}"
+            ok = error is not None and error in str(e)
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {date_range!r} / {constraints!r}: {outcome}")
+
+    runs = 10000
+    started = timer.perf_counter()
+    for _ in range(runs):
+        trip_schedule("July 10 to July 14", "July 12 from 2:00 PM to 5:00 PM", 5, today)
+    print(f"{(timer.perf_counter() - started) / runs * 1e6:.1f} µs per request")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,126 @@
+"""
+Background warm-up for fast cold starts.
+
+backend.main imports neither the OpenAI SDK nor reportlab; both load on
+first use. At startup a WarmUp runs the expensive steps (building the
+model client, importing the PDF stack) in a background thread so the
+process can accept connections immediately, and GET /ready reports when
+they are done.
+
+Import-time budget check (run in CI or before shipping a replica image):
+    python -m backend.warmup [budget_ms]
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Modules backend.main must not import eagerly.
+DEFERRED_MODULES = ("openai", "reportlab")
+
+# Default budget for `import backend.main` in a fresh interpreter.
+IMPORT_BUDGET_MS = 500
+
+
+class WarmUp:
+    """
+    Runs named warm-up steps once, in order, on a daemon thread.
+    A failing step is recorded and the rest still run; the code it was
+    warming will simply load on first use instead.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        self.steps = steps
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at: Optional[float] = None
+        self._results: Dict[str, Dict[str, Any]] = {}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def run(self) -> None:
+        for name, step in self.steps:
+            started = time.monotonic()
+            try:
+                step()
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            with self._lock:
+                self._results[name] = {
+                    "seconds": round(time.monotonic() - started, 3),
+                    "error": error,
+                }
+        self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "started": self._started_at is not None,
+                "elapsed_seconds": (
+                    round(time.monotonic() - self._started_at, 3)
+                    if self._started_at is not None else None
+                ),
+                "steps": {
+                    name: self._results.get(name, {"seconds": None, "error": None, "pending": True})
+                    for name, _ in self.steps
+                },
+            }
+
+
+def measure_import(module: str = "backend.main") -> Tuple[float, List[str]]:
+    """
+    Imports `module` in a fresh interpreter. Returns (milliseconds,
+    deferred modules it loaded anyway).
+    """
+    import json
+    import subprocess
+    import sys
+
+    probe = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = (time.perf_counter() - started) * 1000\n"
+        f"loaded = sorted({{m.split('.')[0] for m in sys.modules}} & set({list(DEFERRED_MODULES)!r}))\n"
+        "print(json.dumps([elapsed, loaded]))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", probe], capture_output=True, text=True, check=True
+    ).stdout
+    elapsed, loaded = json.loads(out.strip().splitlines()[-1])
+    return elapsed, loaded
+
+
+if __name__ == "__main__":
+    import sys
+
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_BUDGET_MS
+    runs = [measure_import() for _ in range(3)]
+    best = min(elapsed for elapsed, _ in runs)
+    loaded = runs[0][1]
+
+    print(f"import backend.main: {best:.0f} ms (best of 3, budget {budget:.0f} ms)")
+    failed = False
+    if loaded:
+        print(f"FAIL: imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if best > budget:
+        print("FAIL: over the import-time budget")
+        failed = True
+    sys.exit(1 if failed else 0)